@@ -1,9 +1,35 @@
-def extra_annotation(op: str, other_ops: list, reduction: float) -> str:
+def extra_annotation(op: str, other_ops: list, reduction: float, saved_ms: float = None) -> str:
     text = f"{op} is faster than using {', '.join(other_ops)} here, " \
            f"and achieved a cost reduction by at least {'{:.1f}'.format(reduction)}x"
+    if saved_ms is not None:
+        text += f", predicted to save {'{:.1f}'.format(saved_ms)} ms"
     return text
 
 
+def enabled_annotation(op: str, other_ops: list, reduction: float, saved_ms: float = None) -> str:
+    text = f"{op} is off by default, turning it on instead of using {', '.join(other_ops)} here " \
+           f"achieved a cost reduction by {'{:.1f}'.format(reduction)}x"
+    if saved_ms is not None:
+        text += f", predicted to save {'{:.1f}'.format(saved_ms)} ms"
+    return text
+
+
+def misestimate_annotation(estimated: float, actual: float, q_error: float, origin: bool) -> str:
+    kind = "under" if actual > estimated else "over"
+    description = f"Estimated {estimated:.0f} rows but got {actual:.0f}, a {q_error:.1f}x {kind}estimate."
+    if origin:
+        reason = "The misestimate starts here, the nodes above inherit it."
+    else:
+        reason = "The misestimate is inherited from the nodes below."
+    return f"{description} {reason}"
+
+
+def cost_summary_annotation(operators: list) -> str:
+    lines = [f"{i + 1}. {label}: {cost:.1f} ({share:.0%})" for i, (label, cost, share) in enumerate(operators)]
+    description = "Most expensive operators, by their own cost:"
+    return "\n".join([description] + lines)
+
+
 def template_annotation() -> str:
     description = ""
     reason = f""
@@ -84,6 +110,72 @@ def limit_annotation() -> str:
     return f"{description}"
 
 
+def index_only_scan_annotation(table_name: str, cond: str) -> str:
+    description = f"Scans the index for rows which match a particular condition, without reading them from " \
+                  f"{table_name} table."
+    reason = f"Index only scan on {table_name} is faster because every column needed is in the index on {cond}, " \
+             f"so only pages not known to be all-visible are read from the table."
+    return f"{description} {reason}"
+
+
+def tid_scan_annotation(table_name: str, cond: str) -> str:
+    description = f"Reads the rows of {table_name} table directly from their physical location, where {cond}."
+    reason = f"TID scan on {table_name} is faster as the rows are fetched without scanning the table or an index."
+    return f"{description} {reason}"
+
+
+def hash_aggregate_annotation(group_keys: list) -> str:
+    description = f"Aggregation is performed on {group_keys} by building a hash table of the groups."
+    reason = "Hash aggregation is faster when the groups fit in memory, as the input does not have to be sorted."
+    return f"{description} {reason}"
+
+
+def incremental_sort_annotation(sort_keys: list, presorted_keys: list) -> str:
+    keys = ", ".join(sort_keys)
+    presorted = ", ".join(presorted_keys)
+    description = f"Sorts rows into an order, with the following sort keys: {keys}"
+    reason = f"Incremental sort is faster as the input is already sorted on {presorted}, " \
+             f"so only the rows of each group of equal {presorted} are sorted."
+    return f"{description} {reason}"
+
+
+def materialize_annotation() -> str:
+    description = "Stores the rows of its input in memory, to be read again without rescanning the input."
+    reason = "Materialize is faster when the input is scanned many times, e.g. the inner side of a nested loop."
+    return f"{description} {reason}"
+
+
+def memoize_annotation(cache_keys: list) -> str:
+    description = f"Caches the rows of its input by {cache_keys}."
+    reason = "Memoize is faster when a nested loop looks up the same values many times, " \
+             "as the repeated lookups are answered from the cache."
+    return f"{description} {reason}"
+
+
+def append_annotation(subplans: int, subplans_removed: int) -> str:
+    description = f"Appends the rows of {subplans} subplans, e.g. the partitions of a table."
+    reason = f"{subplans_removed} more subplans were pruned when running the plan." if subplans_removed else ""
+    return f"{description} {reason}"
+
+
+def parallel_append_annotation(subplans: int, subplans_removed: int) -> str:
+    description = f"Appends the rows of {subplans} subplans, spreading the parallel workers across the subplans."
+    reason = f"{subplans_removed} more subplans were pruned when running the plan." if subplans_removed else ""
+    return f"{description} {reason}"
+
+
+def parallel_hash_annotation() -> str:
+    description = "Hash is performed by all parallel workers into one shared hash table."
+    reason = "Parallel hash is faster than having every worker build its own copy of the hash table."
+    return f"{description} {reason}"
+
+
+def gather_merge_annotation(workers: int) -> str:
+    description = f"Merges the sorted rows of {workers} parallel workers, keeping their order."
+    reason = "Gather merge is faster than gathering the rows and sorting them again."
+    return f"{description} {reason}"
+
+
 def undefined_annotation() -> str:
     description = ""
     return f"{description}"
@@ -0,0 +1,161 @@
+"""
+Headless batch annotation of a query workload
+
+Reads SQL statements from a JSON Lines file (one object per line, the statement under "sql", "query" or
+"statement", or the key given with --sql-key) or from a .sql file (statements separated by semicolons), plans each
+one with its AQPs across a pool of worker processes, each with its own db connection, and streams one JSON record
+per statement: the QEP and AQP trees with their costs, diff marks and annotations, with --analyze the row
+misestimates of the QEP, worst first, and with --cost-model the predicted time of every plan. The most expensive
+operators of the QEP and how the cost of every node type changes in each AQP are included. A statement that fails
+to plan, or a line without a statement, gets a record with an "error" instead of stopping the run.
+
+Usage:
+    python batch.py queries.sql --host 127.0.0.1 --port 5432 --db tpch --user postgres --password secret
+    python batch.py workload.jsonl --workers 8 --output annotated.jsonl --unordered
+    python batch.py workload.jsonl --replay plans.jsonl
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing.util import Finalize
+
+from calibration import CostModel
+from cardinality import find_misestimates
+from cost_breakdown import FlatPlans, node_label
+from node import PlanNode
+from preprocessing import QueryPlanner
+from workload import read_workload
+
+planner: QueryPlanner = None  # The planner of the worker process
+
+
+def init_worker(planner_args: dict) -> None:
+    """
+    Connect the planner of a worker process, it is closed when the worker exits
+    :param planner_args: Keyword arguments of QueryPlanner
+    :return: None
+    """
+    global planner
+    planner = QueryPlanner(**planner_args)
+    Finalize(planner, planner.close, exitpriority=10)
+
+
+def annotate(item: tuple) -> dict:
+    """
+    Plan a statement in a worker process
+    :param item: (id, statement, error), see workload.read_workload
+    :return: The JSON record of the statement
+    """
+    query_id, statement, error = item
+    record = {"id": query_id, "sql": statement, "worker": os.getpid()}
+    if error is not None:
+        record["error"] = error
+        record["elapsed_ms"] = 0.0
+        return record
+
+    start = time.perf_counter()
+    try:
+        planner.generate_plans(statement)
+    except Exception as ex:
+        record["error"] = str(ex)
+        record["elapsed_ms"] = (time.perf_counter() - start) * 1000
+        return record
+
+    qep = planner.qep
+    breakdown = FlatPlans([qep] + [planner.aqp[name] for name in planner.alt_plan_names])
+    deltas = breakdown.type_deltas()
+    record["qep"] = {
+        "cost": qep.cost,
+        "predicted_ms": planner.predicted_time.get("QEP"),
+        "top_operators": [
+            {"operator": node_label(node), "cost": cost, "share": share}
+            for node, cost, share in breakdown.top_operators()
+        ],
+        "plan": PlanNode.to_dict(qep),
+    }
+    record["aqps"] = [
+        {
+            "off": name,
+            "cost": planner.aqp[name].cost,
+            "cost_ratio": planner.without_disable_cost(planner.aqp[name].cost) / qep.cost if qep.cost else None,
+            "predicted_ms": planner.predicted_time.get(name),
+            "cost_delta_by_type": {
+                node_type: delta for node_type, delta in zip(breakdown.type_names.tolist(), deltas[i + 1].tolist())
+                if delta
+            },
+            "annotation": planner.extra_annotation.get(name),
+            "plan": PlanNode.to_dict(planner.aqp[name]),
+        }
+        for i, name in enumerate(planner.alt_plan_names)
+    ]
+    if qep.loops is not None:
+        record["misestimates"] = [
+            {
+                "type": m.node.type,
+                "estimated_rows": m.estimated,
+                "actual_rows": m.actual,
+                "q_error": m.q_error,
+                "origin": m.origin,
+            }
+            for m in find_misestimates(qep)
+        ]
+    record["timed_out"] = planner.timed_out
+    record["unavoidable"] = planner.unavoidable
+    record["elapsed_ms"] = (time.perf_counter() - start) * 1000
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Annotate a query workload without the GUI")
+    parser.add_argument("input", help=".jsonl or .sql file of the statements to plan")
+    parser.add_argument("--host")
+    parser.add_argument("--port", default="5432")
+    parser.add_argument("--db")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    parser.add_argument("--replay", help="fixture of recorded plans to serve instead of a db")
+    parser.add_argument("--sql-key", help="key of the statement in JSON Lines records")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes, one db connection each")
+    parser.add_argument("--chunksize", type=int, default=1, help="statements handed to a worker at a time")
+    parser.add_argument("--unordered", action="store_true",
+                        help="write records as soon as they are ready instead of in input order")
+    parser.add_argument("--analyze", action="store_true", help="run the QEPs with EXPLAIN ANALYZE")
+    parser.add_argument("--plan-timeout", type=int, help="statement timeout of each plan, in ms")
+    parser.add_argument("--request-timeout", type=float, help="time budget of each statement and its AQPs, in s")
+    parser.add_argument("--cost-model", help="cost to time model written by calibration.py, to predict plan times")
+    parser.add_argument("--output", help="file to write the records to, stdout if not given")
+    args = parser.parse_args()
+
+    planner_args = dict(db_host=args.host, db_port=args.port, db_name=args.db, db_user=args.user,
+                        db_password=args.password, replay_path=args.replay, analyze=args.analyze,
+                        plan_timeout=args.plan_timeout, request_timeout=args.request_timeout,
+                        cost_model=CostModel.load(args.cost_model) if args.cost_model else None)
+
+    # Fail fast on bad connection settings, a worker failing to start would be restarted forever by the pool
+    QueryPlanner(**planner_args).close()
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    done = failed = 0
+    start = time.perf_counter()
+    try:
+        with multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(planner_args,)) as pool:
+            imap = pool.imap_unordered if args.unordered else pool.imap
+            for record in imap(annotate, read_workload(args.input, args.sql_key), args.chunksize):
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                done += 1
+                failed += "error" in record
+            pool.close()
+            pool.join()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"{done} statements planned in {time.perf_counter() - start:.1f}s, {failed} failed", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
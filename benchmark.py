@@ -0,0 +1,369 @@
+"""
+Benchmarks of the plan pipeline stages
+
+Times every stage on its own: the EXPLAIN round trip, JSON decode, tree building, tree building while decoding,
+unique node types, tree comparison, annotation generation, cost breakdown, tree layout and canvas rendering. Runs over
+the sample SQL queries (given a db or a recorded fixture) and synthetic plans, reporting time, throughput and peak
+memory per stage, and writes the results as JSON so that runs can be compared.
+
+The import of the library modules is timed too, each in a fresh interpreter. The run fails if one of them loads the
+db driver, Tk or another module that is only meant to be loaded on first use, or takes longer than its import budget,
+or than in the baseline when one is given.
+
+Usage:
+    python benchmark.py --host 127.0.0.1 --port 5432 --db tpch --user postgres --password secret
+    python benchmark.py --replay plans.jsonl --sizes 10,1000,10000 --output results.json --baseline old.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from cost_breakdown import FlatPlans
+from node import PlanNode
+from plan_walk import decode_json, preorder
+from preprocessing import QueryPlanner
+from sample_sql import sql_list
+
+synthetic_node_types = [
+    ("Hash Join", {"Hash Cond": "(a.id = b.id)"}),
+    ("Merge Join", {"Merge Cond": "(a.id = b.id)"}),
+    ("Nested Loop", {}),
+    ("Seq Scan", {"Relation Name": "lineitem", "Filter": "(l_quantity > 10)"}),
+    ("Index Scan", {"Relation Name": "orders", "Index Cond": "(o_orderkey = 1)"}),
+    ("Bitmap Heap Scan", {"Relation Name": "customer"}),
+    ("Sort", {"Sort Key": ["a.id"]}),
+    ("Aggregate", {"Group Key": ["a.id"]}),
+    ("Hash", {}),
+    ("Append", {}),
+]
+
+# Modules imported by headless tools and scripts, with the max median time of their import in ms
+import_budgets = {"node": 5.0, "preprocessing": 10.0, "plan_diff": 5.0, "cardinality": 5.0}
+deferred_modules = ["psycopg2", "tkinter", "numpy", "sqlite3", "concurrent.futures"]  # Only loaded on first use
+
+# Run in a fresh interpreter: imports a module, then prints the import time in ms, the peak memory in KB if traced,
+# and the deferred modules it loaded
+import_probe = """
+import sys, time, tracemalloc
+if sys.argv[2] == "trace":
+    tracemalloc.start()
+start = time.perf_counter()
+__import__(sys.argv[1])
+elapsed = (time.perf_counter() - start) * 1000
+peak = tracemalloc.get_traced_memory()[1] / 1024 if tracemalloc.is_tracing() else 0
+print(elapsed, peak, ",".join(m for m in sys.argv[3:] if m in sys.modules))
+"""
+
+
+def synthetic_plan(size: int, seed: int = 0) -> dict:
+    """
+    Generate a random raw plan
+    :param size: Number of nodes
+    :param seed: Random seed, the same seed gives the same plan
+    :return: The raw plan
+    """
+    rnd = random.Random(seed)
+    nodes = [{"Node Type": "Limit", "Startup Cost": 0.0, "Total Cost": 1.0e6, "Plan Rows": 1}]
+    for i in range(1, size):
+        node_type, fields = rnd.choice(synthetic_node_types)
+        node = {"Node Type": node_type, "Startup Cost": 0.0, "Total Cost": rnd.uniform(1, 1.0e6),
+                "Plan Rows": rnd.randrange(1, 100000)}
+        node.update(fields)
+        # Attach to a recent node, so that the tree is both wide and deep
+        parent = nodes[rnd.randrange(i // 2, i)]
+        parent.setdefault("Plans", []).append(node)
+        nodes.append(node)
+    return nodes[0]
+
+
+def count_nodes(root: PlanNode) -> int:
+    return sum(1 for _ in preorder(root))
+
+
+def annotate(nodes: list) -> None:
+    for node in nodes:
+        node.annotation_text = node.formatted_text = None  # Measure the generation, not the memoized text
+        node.get_formatted_annotations()
+
+
+def measure(func, repeat: int) -> dict:
+    """
+    Time a stage, then measure its peak memory in a separate run
+    :param func: The stage, called without arguments
+    :param repeat: Number of timed runs
+    :return: dict of min_ms, median_ms and peak_kb
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"min_ms": min(times), "median_ms": statistics.median(times), "peak_kb": peak / 1024}
+
+
+def load_db_cases(args) -> tuple:
+    """
+    Plan the sample SQL queries on the db, timing the EXPLAIN round trips
+    :return: (cases, round trip results)
+    """
+    import psycopg2
+    import psycopg2.extras
+
+    conn = psycopg2.connect(host=args.host, port=args.port, database=args.db, user=args.user,
+                            password=args.password)
+    psycopg2.extras.register_default_json(conn, loads=lambda x: x)  # Keep the plans as raw text
+    cursor = conn.cursor()
+
+    cases = []
+    results = []
+    for i, sql_query in enumerate(sql_list):
+        name = f"sql{i + 1}"
+        explain = "EXPLAIN (VERBOSE, FORMAT JSON) " + sql_query
+
+        def round_trip():
+            cursor.execute(explain)
+            text = cursor.fetchone()[0]
+            conn.rollback()
+            return text
+
+        text = round_trip()
+        root = QueryPlanner.build_tree_from_raw_plan(text)
+        results.append(dict(case=name, stage="explain", nodes=count_nodes(root), **measure(round_trip, args.repeat)))
+        cases.append((name, text))
+
+    conn.close()
+    return cases, results
+
+
+def load_replay_cases(path: str) -> list:
+    """
+    Load the plans of a fixture recorded by QueryPlanner(record_path=...)
+    :return: cases
+    """
+    cases = []
+    with open(path) as f:
+        for i, line in enumerate(f):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except RecursionError:
+                # Too deep to decode and encode again, the plan is the JSON text the db returned, recorded last
+                text = line[line.index('"plan": ') + len('"plan": '):line.rstrip().rindex("}")]
+            else:
+                if "plan" not in item:
+                    continue  # Planner method switches of the recording server
+                text = json.dumps(item["plan"])
+            # Recent fixtures hold the whole EXPLAIN output, older ones only its plan
+            cases.append((f"recorded{i + 1}", text if text.lstrip().startswith("[") else '[{"Plan": ' + text + "}]"))
+    return cases
+
+
+def decode_plan(text: str):
+    """
+    Decode EXPLAIN output as the planner does, without recursion if it is nested deeper than json.loads can decode
+    :param text: The EXPLAIN output, as JSON text
+    :return: The decoded plan
+    """
+    try:
+        return json.loads(text)
+    except RecursionError:
+        return decode_json(text)
+
+
+def run_stages(name: str, text: str, repeat: int, tk_root=None) -> list:
+    """
+    Benchmark every stage after the EXPLAIN round trip on a plan
+    :param name: Name of the case
+    :param text: The EXPLAIN output, as JSON text
+    :param repeat: Number of timed runs per stage
+    :param tk_root: Tk root to render in, rendering is skipped if not given
+    :return: list of results
+    """
+    raw = decode_plan(text)[0]["Plan"]
+    root = QueryPlanner.build_tree_from_raw_plan(raw)
+    other = QueryPlanner.build_tree_from_raw_plan(raw)
+    all_nodes = [node for node, _, _ in preorder(root)]
+    nodes = len(all_nodes)
+
+    stages = [
+        ("json_decode", lambda: decode_plan(text)),
+        ("build_tree", lambda: QueryPlanner.build_tree_from_raw_plan(raw)),
+        ("build_from_text", lambda: QueryPlanner.build_tree_from_plan_text(text)),
+        ("unique_node_types", lambda: PlanNode.get_unique_node_types(root)),
+        ("compare_trees", lambda: PlanNode.compare_trees(root, other)),
+        ("annotations", lambda: annotate(all_nodes)),
+        ("cost_breakdown", lambda: FlatPlans([root, other]).type_deltas()),
+    ]
+
+    try:
+        from plan_canvas import PlanCanvas, layout_tree
+    except ImportError:
+        layout_tree = None  # No Tk installed
+    if layout_tree:
+        stages.append(("layout_tree", lambda: layout_tree(root)))
+    if layout_tree and tk_root:
+        from tkinter import Canvas
+
+        def render():
+            canvas = Canvas(tk_root, width=830, height=320)
+            PlanCanvas(canvas, root)
+            tk_root.update_idletasks()
+            canvas.destroy()
+
+        stages.append(("draw_tree", render))
+
+    return [dict(case=name, stage=stage, nodes=nodes, **measure(func, repeat)) for stage, func in stages]
+
+
+def probe_import(module: str, trace: bool = False) -> tuple:
+    """
+    Import a module in a fresh interpreter
+    :param module: Name of the module
+    :param trace: Trace the memory allocated by the import, which slows it down
+    :return: (time in ms, peak memory in KB, list of the deferred modules it loaded)
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    out = subprocess.run([sys.executable, "-c", import_probe, module, "trace" if trace else "time"] + deferred_modules,
+                         cwd=here, capture_output=True, text=True, check=True).stdout.split(" ")
+    return float(out[0]), float(out[1]), [m for m in out[2].strip().split(",") if m]
+
+
+def run_import_stages(repeat: int) -> list:
+    """
+    Benchmark the import of the library modules, the first import of each is not timed as it may compile the module
+    :param repeat: Number of timed imports per module
+    :return: list of results, with the deferred modules each import loaded under eager_imports
+    """
+    results = []
+    for module in import_budgets:
+        _, _, eager_imports = probe_import(module)
+        times = [probe_import(module)[0] for _ in range(repeat)]
+        results.append(dict(case=module, stage="import", nodes=0, min_ms=min(times),
+                            median_ms=statistics.median(times), peak_kb=probe_import(module, trace=True)[1],
+                            eager_imports=eager_imports))
+    return results
+
+
+def check_imports(results: list, budgets: dict = None) -> int:
+    """
+    Print the library modules that load deferred modules or import slower than their budget
+    :param results: Results of run_import_stages
+    :param budgets: Max median import time of each module in ms, import times are not checked if not given
+    :return: number of violations
+    """
+    violations = 0
+    for r in results:
+        if r["eager_imports"]:
+            violations += 1
+            print(f"EAGER IMPORT {r['case']} loads {', '.join(r['eager_imports'])}")
+        budget = budgets.get(r["case"]) if budgets else None
+        if budget is not None and r["median_ms"] > budget:
+            violations += 1
+            print(f"SLOW IMPORT {r['case']} takes {r['median_ms']:.1f} ms, budget is {budget:.1f} ms")
+    return violations
+
+
+def compare_with_baseline(results: list, path: str, threshold: float) -> int:
+    """
+    Print the stages that got slower than in a previous run
+    :return: number of regressions
+    """
+    with open(path) as f:
+        baseline = {(r["case"], r["stage"]): r for r in json.load(f)["results"]}
+
+    regressions = 0
+    for r in results:
+        old = baseline.get((r["case"], r["stage"]))
+        if not old or old["median_ms"] <= 0:
+            continue
+        ratio = r["median_ms"] / old["median_ms"]
+        if ratio > threshold:
+            regressions += 1
+            print(f"REGRESSION {r['case']:>12} {r['stage']:<18} {old['median_ms']:10.3f} -> "
+                  f"{r['median_ms']:10.3f} ms ({ratio:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the plan pipeline stages")
+    parser.add_argument("--host", help="db host, the sample SQL queries are planned on it if given")
+    parser.add_argument("--port", default="5432")
+    parser.add_argument("--db")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    parser.add_argument("--replay", help="fixture of recorded plans to benchmark, instead of a db")
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="node counts of the synthetic plans")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per stage")
+    parser.add_argument("--no-render", action="store_true", help="skip rendering even if a display is available")
+    parser.add_argument("--output", default="benchmark_results.json", help="file to write the results to")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown ratio against the baseline reported as a regression")
+    args = parser.parse_args()
+
+    results = []
+    cases = []
+    if args.host:
+        cases, results = load_db_cases(args)
+    elif args.replay:
+        cases = load_replay_cases(args.replay)
+    for size in [int(x) for x in args.sizes.split(",") if x]:
+        cases.append((f"synthetic{size}", json.dumps([{"Plan": synthetic_plan(size)}])))
+
+    tk_root = None
+    if not args.no_render:
+        try:
+            from tkinter import Tk, TclError
+            try:
+                tk_root = Tk()
+                tk_root.withdraw()
+            except TclError:
+                tk_root = None  # No display
+        except ImportError:
+            pass
+
+    for name, text in cases:
+        results.extend(run_stages(name, text, args.repeat, tk_root))
+    import_results = run_import_stages(args.repeat)
+    results.extend(import_results)
+
+    for r in results:
+        r["nodes_per_s"] = r["nodes"] / (r["median_ms"] / 1000) if r["median_ms"] > 0 else None
+        print(f"{r['case']:>14} {r['stage']:<18} {r['nodes']:>6} nodes {r['median_ms']:10.3f} ms "
+              f"{r['nodes_per_s'] or 0:14.0f} nodes/s {r['peak_kb']:10.1f} KB peak")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "meta": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "repeat": args.repeat,
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    # Import times are checked against the baseline if given, measured on the same machine, or the budgets otherwise
+    failed = check_imports(import_results, None if args.baseline else import_budgets)
+    if args.baseline and compare_with_baseline(results, args.baseline, args.threshold):
+        failed = True
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Calibrated cost to time model
+
+Planner costs are in abstract units. The model turns them into milliseconds on a given machine: it is fitted from
+the plans of EXPLAIN ANALYZE runs, with one linear model per node type of the exclusive time of a node against its
+exclusive cost and estimated rows, and predicts the time of a plan from its estimates alone, without running it.
+
+Exclusive cost and time are those of a node minus those of its children, per run of each node, as the planner
+accounts them. They add up to the cost and time of the whole plan, e.g. the rescans of the inner side of a nested
+loop are part of the nested loop's exclusive cost and time.
+
+Usage:
+    python calibration.py queries.sql --host 127.0.0.1 --port 5432 --db tpch --user postgres --password secret
+    python calibration.py workload.jsonl --replay analyzed.jsonl --output cost_model.json
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from cost_breakdown import without_disable_cost
+from node import PlanNode
+from plan_walk import preorder
+from preprocessing import QueryPlanner
+from workload import read_workload
+
+min_samples = 8  # Samples of a node type needed to fit its own model, others use the model of all samples
+
+
+def exclusive_features(root: PlanNode) -> list:
+    """
+    Get the model inputs of every node of a plan, known without running it
+    The penalty of turned off operations the planner could not avoid is left out of the exclusive cost
+    :param root: The root node
+    :return: list of (node, node type, exclusive cost, estimated rows) in pre-order
+    """
+    return [(n, n.type, float(without_disable_cost(n.cost - sum(c.cost for c in n.children))), n.rows)
+            for n, _, _ in preorder(root)]
+
+
+def collect_samples(root: PlanNode) -> list:
+    """
+    Get the calibration samples of an analyzed plan, nodes that never ran are left out
+    :param root: The root node of a plan from EXPLAIN ANALYZE
+    :return: list of (node type, exclusive cost, estimated rows, exclusive time in ms)
+    """
+    return [
+        (node_type, cost, rows, node.actual_time - sum(c.actual_time for c in node.children))
+        for node, node_type, cost, rows in exclusive_features(root)
+        if node.loops
+    ]
+
+
+class CostModel:
+    """
+    Per node type linear model of exclusive time from exclusive cost and estimated rows
+    """
+    version = 1
+
+    def __init__(self, coefficients: dict, default: list, samples: dict = None):
+        """
+        :param coefficients: dict of node type to [ms per cost unit, ms per row, ms]
+        :param default: Coefficients of the node types without their own
+        :param samples: Number of samples each node type was fitted from
+        """
+        self.coefficients = {key: np.asarray(value, dtype=float) for key, value in coefficients.items()}
+        self.default = np.asarray(default, dtype=float)
+        self.samples = samples or {}
+
+    @classmethod
+    def fit(cls, samples: list) -> "CostModel":
+        """
+        Fit the model with least squares
+        :param samples: list of (node type, exclusive cost, estimated rows, exclusive time in ms),
+                        see collect_samples
+        :return: The model
+        """
+        if not samples:
+            raise Exception("No samples to fit the cost model from")
+
+        types = np.array([s[0] for s in samples])
+        x = np.array([[s[1], s[2], 1.0] for s in samples], dtype=float)
+        y = np.array([s[3] for s in samples], dtype=float)
+
+        default = np.linalg.lstsq(x, y, rcond=None)[0]
+        coefficients = {}
+        counts = {}
+        for node_type in np.unique(types):
+            mask = types == node_type
+            counts[str(node_type)] = int(mask.sum())
+            if mask.sum() >= min_samples:
+                coefficients[str(node_type)] = np.linalg.lstsq(x[mask], y[mask], rcond=None)[0]
+        return cls(coefficients, default, counts)
+
+    def predict(self, root: PlanNode) -> float:
+        """
+        Predict the execution time of a plan
+        :param root: The root node
+        :return: Predicted time in ms
+        """
+        features = exclusive_features(root)
+        x = np.array([[cost, rows, 1.0] for _, _, cost, rows in features], dtype=float)
+        coefficients = np.array([self.coefficients.get(node_type, self.default) for _, node_type, _, _ in features])
+        return max(0.0, float(np.einsum("ij,ij->", x, coefficients)))
+
+    def save(self, path: str) -> None:
+        """
+        Write the model as JSON
+        :param path: Path of the file
+        """
+        with open(path, "w") as f:
+            json.dump({
+                "version": self.version,
+                "coefficients": {key: value.tolist() for key, value in self.coefficients.items()},
+                "default": self.default.tolist(),
+                "samples": self.samples,
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "CostModel":
+        """
+        Read a model written by save
+        :param path: Path of the file
+        :return: The model
+        """
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != cls.version:
+            raise Exception(f"Unsupported cost model version in {path}")
+        return cls(data["coefficients"], data["default"], data.get("samples"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the cost to time model from EXPLAIN ANALYZE runs of a workload")
+    parser.add_argument("input", help=".jsonl or .sql file of the statements to run")
+    parser.add_argument("--host")
+    parser.add_argument("--port", default="5432")
+    parser.add_argument("--db")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    parser.add_argument("--replay", help="fixture of recorded analyzed plans to serve instead of a db")
+    parser.add_argument("--sql-key", help="key of the statement in JSON Lines records")
+    parser.add_argument("--analyze-timeout", type=int, default=30000, help="statement timeout of each run, in ms")
+    parser.add_argument("--output", default="cost_model.json", help="file to write the model to")
+    args = parser.parse_args()
+
+    # The AQPs are run too, they give samples of the operations the QEPs avoid.
+    # Statements are run one at a time, so that they don't slow each other down
+    planner = QueryPlanner(args.host, args.port, args.db, args.user, args.password, replay_path=args.replay,
+                           analyze=True, analyze_aqps=True, analyze_timeout=args.analyze_timeout)
+    samples = []
+    done = failed = 0
+    start = time.perf_counter()
+    try:
+        for query_id, statement, error in read_workload(args.input, args.sql_key):
+            if error is not None:
+                print(f"{query_id}: {error}", file=sys.stderr)
+                failed += 1
+                continue
+            try:
+                planner.generate_plans(statement)
+            except Exception as ex:
+                print(f"{query_id}: {ex}", file=sys.stderr)
+                failed += 1
+                continue
+            for root in [planner.qep] + [planner.aqp[name] for name in planner.alt_plan_names]:
+                samples += collect_samples(root)
+            done += 1
+    finally:
+        planner.close()
+
+    model = CostModel.fit(samples)
+    model.save(args.output)
+    print(f"{len(samples)} samples of {done} statements in {time.perf_counter() - start:.1f}s, {failed} failed, "
+          f"{len(model.coefficients)} node types with their own model", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Cardinality misestimates of EXPLAIN ANALYZE plans
+
+The q-error of a node is how many times its estimated rows are off from the actual rows, in either direction.
+An error made low in the plan is carried up to every node above it, so a node is only where a misestimate
+starts if its q-error is well above those of its children.
+"""
+from node import PlanNode
+from plan_walk import postorder
+
+misestimate_threshold = 10.0  # q-error from which a node's rows are misestimated
+origin_factor = 2.0  # How many times the q-error of the worst child a misestimate has to be, to start at a node
+
+
+def q_error(estimated: float, actual: float) -> float:
+    """
+    Get the q-error of an estimate, both counts are taken as at least 1 row
+    :param estimated: Estimated rows
+    :param actual: Actual rows
+    :return: The q-error, 1 if the estimate is exact
+    """
+    estimated = max(estimated, 1)
+    actual = max(actual, 1)
+    return max(estimated / actual, actual / estimated)
+
+
+class Misestimate:
+    """
+    Row misestimate of a plan node
+    """
+    __slots__ = ("node", "estimated", "actual", "q_error", "inherited", "origin")
+
+    def __init__(self, node: PlanNode, estimated: float, actual: float, inherited: float, origin: bool):
+        """
+        :param node: The plan node
+        :param estimated: Estimated rows over all loops
+        :param actual: Actual rows over all loops
+        :param inherited: Worst q-error of the children, 1 for leaves
+        :param origin: If the misestimate starts at this node
+        """
+        self.node = node
+        self.estimated = estimated
+        self.actual = actual
+        self.q_error = q_error(estimated, actual)
+        self.inherited = inherited
+        self.origin = origin
+
+    @property
+    def underestimate(self) -> bool:
+        return self.actual > self.estimated
+
+
+def find_misestimates(root: PlanNode, threshold: float = misestimate_threshold,
+                      factor: float = origin_factor) -> list:
+    """
+    Find the misestimated nodes of an analyzed plan
+    Nodes that never ran have no q-error, and are skipped
+    :param root: The root node of a plan from EXPLAIN ANALYZE
+    :param threshold: q-error from which a node is misestimated
+    :param factor: A misestimate starts at a node if its q-error is this many times that of its worst child
+    :return: list of Misestimate of the nodes with a q-error of at least threshold, worst first, the nodes
+             where a misestimate starts come before those inheriting one
+    """
+    worst = {}  # Worst q-error in the subtree of each node that ran
+    misestimates = []
+    for node in postorder(root):
+        inherited = max((worst[c] for c in node.children if c in worst), default=1.0)
+        if not node.loops:
+            if inherited > 1.0:
+                worst[node] = inherited
+            continue
+
+        # Estimates are per loop, e.g. of the inner side of a nested loop
+        estimated = node.rows * node.loops
+        actual = node.actual_rows * node.loops
+        error = q_error(estimated, actual)
+        worst[node] = max(error, inherited)
+        if error >= threshold:
+            misestimates.append(Misestimate(node, estimated, actual, inherited, origin=error >= factor * inherited))
+
+    misestimates.sort(key=lambda m: (not m.origin, -m.q_error))
+    return misestimates
@@ -0,0 +1,119 @@
+"""
+Cost breakdown of plans
+
+Plans are flattened once into arrays with one entry per node, all plans together, so that exclusive costs, totals per
+node type and the differences between plans are computed over every plan at once instead of walking the trees.
+The exclusive cost of a node is its cost minus the cost of its children, i.e. what the node itself adds to the plan.
+"""
+import numpy as np
+
+from node import PlanNode, disable_cost
+from plan_walk import preorder
+
+
+def without_disable_cost(cost):
+    """
+    Remove the penalties of turned off operations the planner could not avoid from exclusive costs
+    :param cost: An exclusive cost, or an array of them
+    :return: The cost without the penalties, to the 2 decimals plan costs are given with
+    """
+    return np.round(cost - np.round(np.divide(cost, disable_cost)) * disable_cost, 2)
+
+
+def node_label(node: PlanNode) -> str:
+    """
+    Get the name of a node in summaries, its type and the table it reads if any
+    :param node: The node
+    :return: The label
+    """
+    table_name = getattr(node, "table_name", None)
+    return f"{node.type} on {table_name}" if table_name else node.type
+
+
+class FlatPlans:
+    """
+    Plans flattened into arrays, the nodes of each plan in pre-order, one plan after another
+    """
+
+    def __init__(self, roots: list):
+        """
+        Flatten the plans
+        :param roots: Root nodes of the plans, e.g. the QEP then the AQPs
+        """
+        nodes = []
+        plan = []
+        parent = []
+        for p, root in enumerate(roots):
+            index_of = {}
+            for node, parent_node, _ in preorder(root):
+                index_of[node] = len(nodes)
+                parent.append(index_of[parent_node] if parent_node is not None else -1)
+                plan.append(p)
+                nodes.append(node)
+
+        self.nodes = nodes
+        self.plan_count = len(roots)
+        self.type_names, self.types = np.unique([n.type for n in nodes], return_inverse=True)
+        self.plan = np.array(plan, dtype=np.int64)
+        self.parent = np.array(parent, dtype=np.int64)
+        self.total_cost = np.array([n.cost for n in nodes], dtype=float)
+        self.startup_cost = np.array([n.startup_cost for n in nodes], dtype=float)
+        self.rows = np.array([n.rows for n in nodes], dtype=float)
+
+        self.plan_cost = self.total_cost[self.parent < 0]  # Cost of each plan
+        self.exclusive_cost = self.__exclusive(self.total_cost)
+        self.exclusive_startup_cost = self.__exclusive(self.startup_cost)
+
+    def __exclusive(self, cost: np.ndarray) -> np.ndarray:
+        """
+        Subtract the cost of the children of every node
+        :param cost: Cost of every node
+        :return: Exclusive cost of every node
+        """
+        has_parent = self.parent >= 0
+        children_cost = np.bincount(self.parent[has_parent], weights=cost[has_parent], minlength=len(cost))
+        return without_disable_cost(cost - children_cost)
+
+    def type_totals(self) -> np.ndarray:
+        """
+        Get the exclusive cost of every node type in every plan
+        :return: array of plans by node types, see type_names
+        """
+        type_count = len(self.type_names)
+        totals = np.bincount(self.plan * type_count + self.types, weights=self.exclusive_cost,
+                             minlength=self.plan_count * type_count)
+        return totals.reshape(self.plan_count, type_count)
+
+    def type_deltas(self, base: int = 0) -> np.ndarray:
+        """
+        Get how much more every node type costs in every plan than in one of them, e.g. AQPs against the QEP
+        :param base: Index of the plan compared against
+        :return: array of plans by node types, see type_names
+        """
+        totals = self.type_totals()
+        return np.round(totals - totals[base], 2)
+
+    def top_operators(self, plan: int = 0, k: int = 5) -> list:
+        """
+        Get the nodes of a plan with the highest exclusive cost
+        :param plan: Index of the plan
+        :param k: Max number of nodes
+        :return: list of (node, exclusive cost, share of the plan cost), most expensive first
+        """
+        indexes = np.flatnonzero(self.plan == plan)
+        top = indexes[np.argsort(-self.exclusive_cost[indexes], kind="stable")[:k]]
+        plan_cost = self.plan_cost[plan]
+        shares = self.exclusive_cost[top] / plan_cost if plan_cost else np.zeros(len(top))
+        return [(self.nodes[i], float(self.exclusive_cost[i]), float(share)) for i, share in zip(top, shares)]
+
+    def heat(self, plan: int = 0) -> dict:
+        """
+        Get how expensive the nodes of a plan are relative to each other
+        :param plan: Index of the plan
+        :return: dict of node to its exclusive cost over the highest exclusive cost of the plan, from 0 to 1
+        """
+        indexes = np.flatnonzero(self.plan == plan)
+        cost = np.clip(self.exclusive_cost[indexes], 0, None)
+        highest = cost.max()
+        heat = cost / highest if highest > 0 else np.zeros_like(cost)
+        return {self.nodes[i]: float(h) for i, h in zip(indexes, heat)}
@@ -1,13 +1,31 @@
+import os
+import queue
+import threading
 from functools import partial
 from tkinter import *
 from tkinter import messagebox
 
+from annotation import cost_summary_annotation, misestimate_annotation
+from calibration import CostModel
+from cardinality import find_misestimates
+from cost_breakdown import FlatPlans, node_label
+from metrics import timed
 from node import PlanNode
-from preprocessing import QueryPlanner
+from plan_canvas import PlanCanvas, heat_color
+from preprocessing import PlanningCancelled, QueryPlanner
 from sample_sql import sql_list
 
+POLL_INTERVAL = 50  # ms between checks for plans posted by the planning worker
+PLAN_TIMEOUT = 30000  # ms each plan may take before it's reported as timed out
+COST_MODEL_PATH = "cost_model.json"  # Cost to time model written by calibration.py, times are predicted if found
+ORIGIN_COLOR = "red"  # Outline of the nodes where a row misestimate starts
+MISESTIMATE_COLOR = "#FFBF00"  # Outline of the nodes inheriting a row misestimate
+
 
 class ToolTip(object):
+    # Only one tooltip is visible at a time, all of them share one window that is hidden instead of destroyed
+    window = None
+    label = None
 
     def __init__(self, widget):
         self.widget = widget
@@ -15,87 +33,117 @@ class ToolTip(object):
         self.id = None
         self.x = self.y = 0
 
-    def showtip(self, text):
+    def showtip(self, text, x, y):
         """
         Display text in tooltip window
         :param text: the text to be displayed
+        :param x: the screen x coordinate to display the tooltip near
+        :param y: the screen y coordinate to display the tooltip near
         """
         self.text = text
         if self.tipwindow or not self.text:
             return
-        x, y, cx, cy = self.widget.bbox("insert")
-        x = x + self.widget.winfo_rootx() + 30
-        y = y + cy + self.widget.winfo_rooty() + 20
-        self.tipwindow = tw = Toplevel(self.widget)
-        tw.wm_overrideredirect(1)
+        x = x + 30
+        y = y + 20
+        self.tipwindow = tw = self.get_window(self.widget)
+        ToolTip.label.configure(text=self.text)
         tw.wm_geometry("+%d+%d" % (x, y))
-        label = Label(tw, text=self.text, justify=LEFT,
-                      background="white", relief=SOLID, borderwidth=1,
-                      font=("tahoma", "12", "normal"))
-        label.pack(ipadx=1)
+        tw.deiconify()
+        tw.lift()
 
     def hidetip(self):
         tw = self.tipwindow
         self.tipwindow = None
-        if tw:
-            tw.destroy()
-
+        if tw and tw.winfo_exists():
+            tw.withdraw()
 
-def create_tooltip(widget, text):
+    @classmethod
+    def get_window(cls, widget):
+        """
+        Get the shared tooltip window, it's created again if it was destroyed along with the page
+        :param widget: any widget of the application
+        """
+        if cls.window is None or not cls.window.winfo_exists():
+            cls.window = tw = Toplevel(widget.winfo_toplevel())
+            tw.withdraw()
+            tw.wm_overrideredirect(1)
+            cls.label = Label(tw, justify=LEFT,
+                              background="white", relief=SOLID, borderwidth=1,
+                              font=("tahoma", "12", "normal"))
+            cls.label.pack(ipadx=1)
+        return cls.window
+
+
+def format_node_stats(tree: PlanNode, exclusive_cost=None) -> str:
     """
-    creates a ToolTip object for the widget
-    :param widget: the widget to display a ToolTip
-    :param text: the text to be displayed
+    formats the estimated cost and rows of a node, next to its actual run statistics when analyzed
+    :param tree: the plan node
+    :param exclusive_cost: the cost of the node itself, without its children
     """
-    tool_tip = ToolTip(widget)
-
-    def enter(event):
-        tool_tip.showtip(text)
-
-    def leave(event):
-        tool_tip.hidetip()
-
-    widget.bind('<Enter>', enter)
-    widget.bind('<Leave>', leave)
-
-
-def draw_tree(tree: PlanNode, frame, no_annotation=False):
+    text = f"Cost: {tree.cost}"
+    if exclusive_cost is not None:
+        text += f" (own: {exclusive_cost:.2f})"
+    text += f"\nRows: {tree.rows}"
+    if tree.loops is not None:
+        text += f" (actual: {tree.actual_rows} x {tree.loops} loops)\n" \
+                f"Actual time: {tree.actual_time} ms x {tree.loops} loops\n" \
+                f"Buffers: shared hit={tree.shared_hit} read={tree.shared_read}, " \
+                f"local hit={tree.local_hit} read={tree.local_read}"
+    return text
+
+
+def draw_tree(tree: PlanNode, canvas, no_annotation=False, breakdown=None):
     """
-    draws the query execution plan in a binary tree form
+    draws the query execution plan in a tree form on a single canvas
     :param tree: the root plan node to access the query execution plan
-    :param frame: the frame to display the tree in
+    :param canvas: the canvas to draw the tree on
     :param no_annotation: boolean to display annotations for QEP but not AQP
+    :param breakdown: the plan flattened on its own, see cost_breakdown.FlatPlans, for the cost of each node itself
     """
-    frame_top = Frame(frame, bg="white")
-    frame_top.pack(ipadx=5, fill=X)
-    frame_bottom = Frame(frame, bg="white")
-    frame_bottom.pack(fill=X)
-
-    # Displays the current node
-    if len(tree.type) > 12:
-        width = 13
-    else:
-        width = 10
+    tool_tip = ToolTip(canvas)
+    texts = {}  # Tooltip text of the nodes hovered so far, once final
+    exclusive_costs = dict(zip(breakdown.nodes, breakdown.exclusive_cost.tolist())) if breakdown else {}
+
+    # Nodes colored by their own cost, the diff nodes are dashed instead of red
+    fills = None
+    if breakdown and show_heat_map:
+        fills = {node: heat_color(heat) for node, heat in breakdown.heat().items()}
+
+    # Row misestimates of analyzed plans
+    misestimates = {m.node: m for m in find_misestimates(tree)} if tree.loops is not None else {}
+    outlines = {node: ORIGIN_COLOR if m.origin else MISESTIMATE_COLOR for node, m in misestimates.items()}
+
+    def enter(node, event):
+        text = texts.get(node)
+        if text is None:
+            text = get_tooltip_text(node, no_annotation, misestimates.get(node), exclusive_costs.get(node))
+            # The extra annotations of the QEP keep coming in with the AQPs, its texts are only kept once planning ends
+            if no_annotation or plan_results is None:
+                texts[node] = text
+        tool_tip.showtip(text, event.x_root, event.y_root)
+
+    def leave(node, event):
+        tool_tip.hidetip()
 
-    # change node color if the node is "is_diff"
-    if tree.is_diff:
-        box_bg = "red"
-        box_fg = "white"
-    else:
-        box_bg = "white"
-        box_fg = "black"
+    return PlanCanvas(canvas, tree, on_enter=enter, on_leave=leave, outlines=outlines, fills=fills)
 
-    label = Label(frame_top, text=tree.type, fg=box_fg, bg=box_bg, relief=SOLID, borderwidth=1, width=width)
-    label.pack()
 
+def get_tooltip_text(tree: PlanNode, no_annotation=False, misestimate=None, exclusive_cost=None) -> str:
+    """
+    builds the tooltip text of a plan node
+    :param tree: the plan node
+    :param no_annotation: boolean to display annotations for QEP but not AQP
+    :param misestimate: the row misestimate of the node, see cardinality.Misestimate, None if not misestimated
+    :param exclusive_cost: the cost of the node itself, without its children
+    """
     # Process tooltip content
-    extra_annotation = qp.extra_annotation.get(tree.type, None)
+    extra_annotations = qp.get_extra_annotations(tree.type)
 
     if no_annotation:
-        tooltip_text = f"Cost: {tree.cost}"
+        tooltip_text = format_node_stats(tree, exclusive_cost)
     else:
-        tooltip_text = f"Cost: {tree.cost}\n\n{tree.get_formatted_annotations()}"
-        if extra_annotation:
+        tooltip_text = f"{format_node_stats(tree, exclusive_cost)}\n\n{tree.get_formatted_annotations()}"
+        for extra_annotation in extra_annotations:
             # add line break if more than 70 characters
             if len(extra_annotation) >= 70:
                 last_space_before = extra_annotation[:70].rindex(' ')
@@ -103,54 +151,104 @@ def draw_tree(tree: PlanNode, frame, no_annotation=False):
                                                                                  last_space_before + 1:]
             tooltip_text += f"\n{extra_annotation}"
 
-    create_tooltip(
-        label,
-        text=tooltip_text
-    )
-
-    # Displays the child nodes
-    if len(tree.children) > 0:
-        Label(frame_top, text="|", bg="white").pack()
-        frame_arrow = Frame(frame_top, bg="white")
-        frame_arrow.pack(expand=True, fill=X)
-        frame_arrow.grid_columnconfigure(0, weight=1)
-        frame_arrow.grid_columnconfigure(1, weight=3)
-        frame_arrow.grid_columnconfigure(2, weight=1)
-        frame_arrow.grid_rowconfigure(0, weight=1)
-
-        if len(tree.children) == 2:
-            Label(frame_arrow, text=" ", bg="white").grid(row=0, column=0, sticky="ew")
-            Canvas(frame_arrow, height=2, width=20, bg='black').grid(row=0, column=1, sticky="ew")
-            Label(frame_arrow, text=" ", bg="white").grid(row=0, column=2, sticky="ew")
-
-            frame_left = Frame(frame_bottom, bg="white")
-            frame_left.pack(side=LEFT, anchor=N, expand=True)
-            draw_tree(tree.children[0], frame_left, no_annotation)
-
-            frame_right = Frame(frame_bottom, bg="white")
-            frame_right.pack(side=LEFT, anchor=N, expand=True)
-            draw_tree(tree.children[1], frame_right, no_annotation)
-        else:
-            Label(frame_arrow, text="|", bg="white").pack()
-
-            frame_left = Frame(frame_bottom, bg="white")
-            frame_left.pack(side=LEFT, anchor=N, expand=True)
-            draw_tree(tree.children[0], frame_left, no_annotation)
+    if misestimate:
+        tooltip_text += "\n\n" + misestimate_annotation(misestimate.estimated, misestimate.actual,
+                                                       misestimate.q_error, misestimate.origin)
+    return tooltip_text
 
 
 def get_input():
     """
-    gets the query execution plan from the query in the text input
+    starts generating the query execution plans from the query in the text input, on a background worker
     """
-    global qp, query
-    annotate_submit_btn.config(text="Generating...")
+    global query, plan_results, planning_cancelled, alt_plans, show_heat_map
+    if plan_results:
+        return  # still planning
+
     query = textinput.get("1.0", END)
+    qp.analyze = bool(analyze_var.get())
+    show_heat_map = bool(heat_map_var.get())
+    alt_plans = []
+    plan_views.clear()
+    planning_cancelled = False
+    plan_results = queue.Queue()
+    threading.Thread(target=plan_worker, args=(query, plan_results), daemon=True).start()
+    update_planning_controls()
+    root.after(POLL_INTERVAL, poll_plans)
+
+
+def plan_worker(sql_query, results):
+    """
+    generates the plans off the Tk thread, posting each plan to the results queue as it completes
+    :param sql_query: the sql query to generate plans for
+    :param results: the queue polled by poll_plans
+    """
     try:
-        qp.generate_plans(query)
-        page_change()
+        qp.generate_plans(sql_query, on_plan=lambda name, node: results.put(("plan", name, node)))
+        results.put(("done", None, None))
+    except PlanningCancelled:
+        results.put(("cancelled", None, None))
     except Exception as ex:
-        messagebox.showerror("SQL Error", ex)
-        annotate_submit_btn.config(text="Annotate")
+        results.put(("error", None, ex))
+
+
+def poll_plans():
+    """
+    renders the plans posted by the planning worker, the QEP as soon as it arrives, then each AQP as it completes
+    """
+    global plan_results
+    while True:
+        try:
+            kind, name, value = plan_results.get_nowait()
+        except queue.Empty:
+            root.after(POLL_INTERVAL, poll_plans)
+            return
+
+        if kind == "plan":
+            if planning_cancelled:
+                continue
+            if name is None:
+                page_change()  # QEP arrived, show the output page
+            else:
+                alt_plans.append((name, value))
+                add_alt_plan_button(name, value)
+            continue
+
+        # Worker finished
+        plan_results = None
+        if kind == "error":
+            messagebox.showerror("SQL Error", value)
+        update_planning_controls()
+        return
+
+
+def cancel_planning():
+    """
+    aborts the in-flight plan generation
+    """
+    global planning_cancelled
+    if plan_results and not planning_cancelled:
+        planning_cancelled = True
+        qp.cancel()
+        update_planning_controls()
+
+
+def update_planning_controls():
+    """
+    shows the cancel controls of the current page while plans are being generated, hides them otherwise
+    """
+    global planning_status
+    planning = plan_results is not None
+    if page_num == 1:
+        if planning:
+            annotate_submit_btn.config(text="Cancelling..." if planning_cancelled else "Generating...", state=DISABLED)
+            cancel_btn.pack()
+        else:
+            annotate_submit_btn.config(text="Annotate", state=NORMAL)
+            cancel_btn.pack_forget()
+    elif planning_status:
+        planning_status.destroy()
+        planning_status = None
 
 
 def main_page(win):
@@ -158,7 +256,7 @@ def main_page(win):
     displays the UI for the input page to input the sql query
     :param win: the main window to display the input page
     """
-    global textinput, annotate_submit_btn
+    global textinput, annotate_submit_btn, cancel_btn, analyze_var, heat_map_var
 
     # Display title
     frame_main_title = Frame(win, bg='#3B86A7', height=60)
@@ -182,10 +280,17 @@ def main_page(win):
     subtitle.pack(fill='x')
     textinput = Text(frame_main_left, width=60, height=20, bg="#CCE4EB")
     textinput.pack(fill='both')
-    Label(frame_main_left, text=" ", bg="white").pack()
+    analyze_var = IntVar(value=int(qp.analyze))
+    Checkbutton(frame_main_left, text="Run EXPLAIN ANALYZE (executes the query, then rolls it back)",
+                variable=analyze_var, bg="white", fg="black", anchor='w').pack(fill='x')
+    heat_map_var = IntVar(value=int(show_heat_map))
+    Checkbutton(frame_main_left, text="Color nodes by their own cost, with the most expensive operators",
+                variable=heat_map_var, bg="white", fg="black", anchor='w').pack(fill='x')
     annotate_submit_btn = Button(frame_main_left, text="Annotate", width=10, height=1, bg="#3B86A7",
                                  fg="black", font="Inter 16", command=get_input)
     annotate_submit_btn.pack()
+    cancel_btn = Button(frame_main_left, text="Cancel", width=10, height=1, bg="#3B86A7",
+                        fg="black", font="Inter 16", command=cancel_planning)  # shown while planning
 
     # Buttons to use example SQL input
     frame_main_right = Frame(frame_main_bottom, bg='white', padx=10, pady=10)
@@ -224,6 +329,7 @@ def output_page(win, plan_root: PlanNode, no_annotation=False):
     :param plan_root: the root plan node to access the query execution plan
     :param no_annotation: boolean to display annotations for QEP but not AQP
     """
+    global frame_plan_views
 
     # Display title
     frame_output_title = Frame(win, bg='#3B86A7', height=60, padx=40)
@@ -243,33 +349,10 @@ def output_page(win, plan_root: PlanNode, no_annotation=False):
     frame_output_content.columnconfigure(0, weight=3)
     frame_output_content.columnconfigure(1, weight=1)
 
-    # Display annotation frame
-    frame_output = Frame(frame_output_content, bg="white", height=320, width=850, padx=0, pady=0)
-    frame_output.pack(fill='x')
-
-    canvas = Canvas(frame_output, bg="white", height=320, width=830)
-    vsb = Scrollbar(frame_output, orient="vertical", command=canvas.yview)
-    hsb = Scrollbar(frame_output, orient="horizontal", command=canvas.xview)
-    canvas.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
-    canvas.grid(row=0, column=0, sticky="nsew")
-    vsb.grid(row=0, column=1, sticky="ns")
-    hsb.grid(row=1, column=0, sticky="ew")
-
-    scrollable_frame = Frame(canvas, bg="white")
-    scrollable_frame.bind(
-        "<Configure>",
-        lambda e: canvas.configure(
-            scrollregion=canvas.bbox("all")
-        )
-    )
-    Label(scrollable_frame, text="", bg="white").pack()
-    canvas.create_window((415, 250), window=scrollable_frame, anchor="n")
-    draw_tree(plan_root, scrollable_frame, no_annotation)
-    Label(scrollable_frame, text="", bg="white").pack()
-
-    plan_cost_title = Label(frame_output, text=f"Plan cost: {plan_root.cost}", bg="white", fg="black",
-                            font="Inter 18 bold")
-    plan_cost_title.place(x=20, y=20)
+    # Display annotation frame, holding one view per plan
+    frame_plan_views = Frame(frame_output_content, bg="white", height=320, width=850, padx=0, pady=0)
+    frame_plan_views.pack(fill='x')
+    refresh_output_page(plan_root, no_annotation)
 
     # Display bottom frame
     frame_output_bottom = Frame(frame_output_content, bg="white", height=170, width=850, padx=0, pady=0)
@@ -291,16 +374,59 @@ def output_page(win, plan_root: PlanNode, no_annotation=False):
     alt_plans_buttons(frame_output_bottom_aqp, frame_output_bottom_qep)
 
 
-def refresh_output_page(win, plan_root: PlanNode, no_annotation=False):
+def refresh_output_page(plan_root: PlanNode, no_annotation=False, key="QEP"):
     """
-    switches UI to display the alternate plan
-    :param win: the main window to display the annotations of query execution plan
-    :param plan_root: the root plan node to access the alternate plan
+    switches UI to display the plan, its view is built on first display and only shown again afterwards
+    :param plan_root: the root plan node to access the plan
     :param no_annotation: boolean to display annotations for QEP but not AQP
+    :param key: "QEP", or the operation turned off in the alternate plan
     """
-    for widget in win.winfo_children():
-        widget.destroy()
-    output_page(win, plan_root, no_annotation)
+    global current_plan_view
+    view = plan_views.get(plan_root)
+    if view is None:
+        with timed(qp.collector, "render"):
+            view = plan_view(frame_plan_views, plan_root, no_annotation, key)
+            if qp.collector:
+                view.update_idletasks()  # Include the drawing itself in the render time
+        plan_views[plan_root] = view
+
+    if current_plan_view is not None and current_plan_view is not view:
+        current_plan_view.pack_forget()
+    view.pack(fill='x')
+    current_plan_view = view
+
+
+def plan_view(frame, plan_root: PlanNode, no_annotation=False, key="QEP"):
+    """
+    builds the view of a plan: the plan tree and its cost
+    :param frame: the frame to build the view in
+    :param plan_root: the root plan node to access the plan
+    :param no_annotation: boolean to display annotations for QEP but not AQP
+    :param key: "QEP", or the operation turned off in the alternate plan, for its predicted time
+    """
+    view = Frame(frame, bg="white", height=320, width=850, padx=0, pady=0)
+
+    canvas = Canvas(view, bg="white", height=320, width=830)
+    vsb = Scrollbar(view, orient="vertical", command=canvas.yview)
+    hsb = Scrollbar(view, orient="horizontal", command=canvas.xview)
+    canvas.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
+    canvas.grid(row=0, column=0, sticky="nsew")
+    vsb.grid(row=0, column=1, sticky="ns")
+    hsb.grid(row=1, column=0, sticky="ew")
+    breakdown = FlatPlans([plan_root])
+    draw_tree(plan_root, canvas, no_annotation, breakdown)
+
+    cost_text = f"Plan cost: {plan_root.cost}"
+    predicted = qp.predicted_time.get(key)
+    if predicted is not None:
+        cost_text += f" (~{predicted:.1f} ms)"
+    plan_cost_title = Label(view, text=cost_text, bg="white", fg="black", font="Inter 18 bold")
+    plan_cost_title.place(x=20, y=20)
+    if show_heat_map:
+        operators = [(node_label(node), cost, share) for node, cost, share in breakdown.top_operators()]
+        Label(view, text=cost_summary_annotation(operators), bg="white", fg="black", font="Inter 11",
+              justify=LEFT).place(x=20, y=60)
+    return view
 
 
 def alt_plans_buttons(frame_aqp, frame_qep):
@@ -309,15 +435,40 @@ def alt_plans_buttons(frame_aqp, frame_qep):
     :param frame_aqp: the frame in which to display the alternate query plan buttons
     :param frame_qep: the frame in which to display the query execution plan button
     """
+    global frame_alt_plans, planning_status
     org_btn = Button(frame_qep, text=f"Original Plan", width=10, height=1, bg="#3B86A7", fg="black", font="Inter 14",
-                     command=partial(refresh_output_page, root, qp.qep, False))
+                     command=partial(refresh_output_page, qp.qep, False))
     org_btn.place(relx=0.5, rely=0.5, anchor=CENTER)
-    keep = []
-    for key, node in qp.aqp.items():
-        plan1_btn = Button(frame_aqp, text=f"No {key}", width=10, height=1, bg="#3B86A7", fg="black", font="Inter 14",
-                           command=partial(refresh_output_page, root, node, True))
-        plan1_btn.pack()
-        keep.append(plan1_btn)
+
+    frame_alt_plans = frame_aqp
+    for key, node in alt_plans:
+        add_alt_plan_button(key, node)
+
+    # Alt plans still being generated
+    planning_status = None
+    if plan_results and not planning_cancelled:
+        planning_status = Frame(frame_qep, bg="white")
+        planning_status.place(relx=0.5, rely=0.85, anchor=CENTER)
+        Label(planning_status, text="Generating alt plans...", bg="white", fg="black", font="Inter 12").pack()
+        Button(planning_status, text="Cancel", width=10, height=1, bg="#3B86A7", fg="black", font="Inter 14",
+               command=cancel_planning).pack()
+
+
+def add_alt_plan_button(key, node):
+    """
+    displays a button to switch to an alternate plan, if the output page is shown
+    :param key: the operation turned off in the alternate plan, or turned on if it is off by default
+    :param node: the root plan node of the alternate plan, None if it timed out
+    """
+    if page_num != 2:
+        return
+    label = f"With {key}" if key in qp.off_by_default else f"No {key}"
+    if node is None:
+        Button(frame_alt_plans, text=f"{label} (timed out)", width=10, height=1, bg="#3B86A7", fg="black",
+               font="Inter 14", state=DISABLED).pack()
+        return
+    Button(frame_alt_plans, text=label, width=10, height=1, bg="#3B86A7", fg="black", font="Inter 14",
+           command=partial(refresh_output_page, node, True, key)).pack()
 
 
 def connect_db_form():
@@ -377,7 +528,8 @@ def login_db(credentials: list):
     """
     global qp, is_logged_in
     try:
-        qp = QueryPlanner(*credentials)
+        cost_model = CostModel.load(COST_MODEL_PATH) if os.path.exists(COST_MODEL_PATH) else None
+        qp = QueryPlanner(*credentials, plan_timeout=PLAN_TIMEOUT, cost_model=cost_model)
         is_logged_in = True
         top.destroy()
         top.update()
@@ -392,16 +544,20 @@ def page_change():
     """
     to switch between the input query page and output annotation page
     """
-    global page_num, root
+    global page_num, root, current_plan_view
     for widget in root.winfo_children():
         widget.destroy()
+    plan_views.clear()  # destroyed with the output page
+    current_plan_view = None
 
     if page_num == 1:
-        output_page(root, qp.qep)
         page_num = 2
+        output_page(root, qp.qep)
     else:
-        main_page(root)
+        cancel_planning()  # leaving the plans being generated
         page_num = 1
+        main_page(root)
+        update_planning_controls()
 
 
 def center(win):
@@ -423,13 +579,36 @@ def center(win):
 
 
 page_num = 1
+plan_results = None  # queue of the planning worker, None when not planning
+planning_cancelled = False
+alt_plans = []  # (operation turned off, root node) of the AQPs received so far
+frame_alt_plans = None
+planning_status = None
+plan_views = {}  # root plan node -> its view on the output page, built on first display
+current_plan_view = None
+show_heat_map = False  # Color the plan nodes by their own cost
+frame_plan_views = None
 
 is_logged_in = False
-root = Tk()
-root.geometry("850x650")
-root.resizable(False, False)
-root.title("CZ4031 Database System Principles GUI")
-root.configure(background="white")
-center(root)
-connect_db_form()
-root.mainloop()
+qp = None  # the query planner, connected on login
+root = None  # the main window, created by main
+
+
+def main():
+    """
+    Open the main window with the db login form, the GUI is only built here so that importing the module has no
+    side effects
+    """
+    global root
+    root = Tk()
+    root.geometry("850x650")
+    root.resizable(False, False)
+    root.title("CZ4031 Database System Principles GUI")
+    root.configure(background="white")
+    center(root)
+    connect_db_form()
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
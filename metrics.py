@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+
+# Shared by every stage timed without a collector, so disabled instrumentation allocates nothing
+null_stage = nullcontext()
+
+
+class MetricsCollector:
+    """
+    Base class of metrics collectors, override the callbacks of interest
+    Stages: connect, fingerprint, cache, execute, fetch, build (decoding the plan JSON), diff, predict, render
+    Counters: round_trips, set_statements, plan_bytes
+    """
+
+    def on_stage(self, stage: str, seconds: float) -> None:
+        """
+        Called when a stage finishes
+        :param stage: Name of the stage
+        :param seconds: Time spent in the stage
+        """
+
+    def on_count(self, counter: str, value: int) -> None:
+        """
+        Called to increase a counter
+        :param counter: Name of the counter
+        :param value: Amount to increase it by
+        """
+
+    def on_plan(self, plan_name: str, node_count: int) -> None:
+        """
+        Called when a plan tree is built
+        :param plan_name: "QEP", or the operation turned off in the AQP
+        :param node_count: Number of nodes in the plan
+        """
+
+
+class StageTimer:
+    """
+    Context manager reporting the time spent inside it to a collector
+    """
+    __slots__ = ("collector", "stage", "start")
+
+    def __init__(self, collector: MetricsCollector, stage: str):
+        self.collector = collector
+        self.stage = stage
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.collector.on_stage(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def timed(collector: MetricsCollector, stage: str):
+    """
+    Time a stage
+    :param collector: The collector to report to, nothing is timed if None
+    :param stage: Name of the stage
+    :return: context manager
+    """
+    if collector is None:
+        return null_stage
+    return StageTimer(collector, stage)
+
+
+class PlannerMetrics(MetricsCollector):
+    """
+    Collector keeping totals per stage, counter and plan
+    """
+
+    def __init__(self):
+        self.stage_seconds = defaultdict(float)
+        self.stage_calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.plan_nodes = {}
+        self.__lock = threading.Lock()  # Called from the planner's worker threads in pooled mode
+
+    def on_stage(self, stage: str, seconds: float) -> None:
+        with self.__lock:
+            self.stage_seconds[stage] += seconds
+            self.stage_calls[stage] += 1
+
+    def on_count(self, counter: str, value: int) -> None:
+        with self.__lock:
+            self.counters[counter] += value
+
+    def on_plan(self, plan_name: str, node_count: int) -> None:
+        with self.__lock:
+            self.plan_nodes[plan_name] = node_count
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.stage_seconds.clear()
+            self.stage_calls.clear()
+            self.counters.clear()
+            self.plan_nodes.clear()
+
+    def summary(self) -> dict:
+        """
+        Get the totals
+        :return: dict of stages (ms and calls), counters and plan node counts
+        """
+        with self.__lock:
+            return {
+                "stages": {
+                    stage: {"ms": seconds * 1000, "calls": self.stage_calls[stage]}
+                    for stage, seconds in self.stage_seconds.items()
+                },
+                "counters": dict(self.counters),
+                "plans": dict(self.plan_nodes),
+            }
+
+    def __str__(self):
+        with self.__lock:
+            lines = [f"{stage:<12} {seconds * 1000:10.2f} ms  x{self.stage_calls[stage]}"
+                     for stage, seconds in sorted(self.stage_seconds.items(), key=lambda x: -x[1])]
+            lines += [f"{counter:<12} {value:10d}" for counter, value in self.counters.items()]
+            lines += [f"{name:<12} {count:10d} nodes" for name, count in self.plan_nodes.items()]
+        return "\n".join(lines)
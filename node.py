@@ -1,4 +1,12 @@
-from annotation import *
+from annotation import (
+    aggregate_annotation, append_annotation, bit_map_heap_scan_annotation, gather_merge_annotation,
+    hash_aggregate_annotation, hash_annotation, hash_join_annotation, incremental_sort_annotation,
+    index_only_scan_annotation, index_scan_annotation, limit_annotation, materialize_annotation, memoize_annotation,
+    merge_join_annotation, nested_loop_annotation, parallel_append_annotation, parallel_hash_annotation,
+    seq_scan_annotation, sort_annotation, tid_scan_annotation,
+)
+from plan_diff import PlanDiff, diff_trees
+from plan_walk import postorder, preorder
 
 supported_node_types = [
     "Sort",
@@ -11,37 +19,104 @@ supported_node_types = [
     "Hash",
     "Nested Loop",
     "Limit",
+    "Index Only Scan",
+    "Tid Scan",
+    "HashAggregate",
+    "Incremental Sort",
+    "Materialize",
+    "Memoize",
+    "Append",
+    "Parallel Append",
+    "Parallel Hash",
+    "Gather Merge",
 ]
 
+# Keys of the actual run statistics of an EXPLAIN ANALYZE plan node, in the order they are stored
+actual_stat_keys = [
+    "Actual Total Time",
+    "Actual Rows",
+    "Actual Loops",
+    "Shared Hit Blocks",
+    "Shared Read Blocks",
+    "Local Hit Blocks",
+    "Local Read Blocks",
+]
+
+disable_cost = 1.0e10  # Added by the planner to the cost of a node using a turned off operation
+
+
+def actual_stat(index: int) -> property:
+    """
+    Read-only attribute of one of the actual run statistics of a node, None if the plan was not analyzed
+    :param index: Position of the statistic in actual_stat_keys
+    """
+    return property(lambda self: self.actual[index] if self.actual is not None else None)
+
 
 class PlanNode:
     """
     Base class for Plan nodes
+    Nodes are slotted and leaves share the empty children tuple, as many plans are kept in memory at once
     """
+    __slots__ = ("cost", "startup_cost", "rows", "is_diff", "children", "actual", "annotation_text", "formatted_text")
     type = "Base"
 
+    # Actual run statistics, only available for plans from EXPLAIN ANALYZE
+    actual_time = actual_stat(0)  # Total time per loop, in ms
+    actual_rows = actual_stat(1)  # Rows per loop
+    loops = actual_stat(2)
+    shared_hit = actual_stat(3)  # Buffers
+    shared_read = actual_stat(4)
+    local_hit = actual_stat(5)
+    local_read = actual_stat(6)
+
     def __init__(self, cost: float, row: int):
         self.cost = cost
+        self.startup_cost = 0.0  # Cost before the first row is returned
         self.rows = row
         self.is_diff = False  # If this node is diff from another plan
-        self.children: ["PlanNode"] = []
+        self.children: tuple = ()
+        self.actual = None  # Tuple of the actual run statistics, see actual_stat_keys
+
+        # Annotations, generated on first use as most nodes are never looked at
+        self.annotation_text = None
+        self.formatted_text = None
 
     def get_annotations(self):
         raise NotImplementedError
 
+    def get_annotation_text(self) -> str:
+        """
+        Get the annotations of the node, generated once
+        """
+        if self.annotation_text is None:
+            self.annotation_text = self.get_annotations()
+        return self.annotation_text
+
     def get_formatted_annotations(self):
         """
-        Post process annotation
+        Post process annotation, generated once
         """
+        if self.formatted_text is not None:
+            return self.formatted_text
+
         n = 12
-        s = self.get_annotations()
+        s = self.get_annotation_text()
         a = s.split()
         ret = ''
         for i in range(0, len(a), n):
             ret += ' '.join(a[i:i + n]) + '\n'
 
+        self.formatted_text = ret
         return ret
 
+    def set_actual_stats(self, plan: dict) -> None:
+        """
+        Store the actual run statistics of the node
+        :param plan: Node from an EXPLAIN ANALYZE plan
+        """
+        self.actual = tuple(plan.get(key) for key in actual_stat_keys)
+
     @classmethod
     def create_node(cls, plan: dict) -> "PlanNode":
         """
@@ -49,6 +124,34 @@ class PlanNode:
         :param plan: QEP from PostgresSQL
         :return:
         """
+        node = cls.__create_typed_node(plan)
+        node.startup_cost = plan.get("Startup Cost", 0.0)
+        if "Actual Loops" in plan:
+            node.set_actual_stats(plan)
+        return node
+
+    @classmethod
+    def from_json_object(cls, obj: dict):
+        """
+        Object hook of json.loads building the plan nodes as their JSON objects are decoded, children first
+        :param obj: A decoded JSON object
+        :return: The node if the object is a plan node, the object otherwise
+        """
+        if "Node Type" not in obj:
+            return obj
+        node = cls.create_node(obj)
+        children = obj.get("Plans")
+        if children:
+            node.children = tuple(children)
+        return node
+
+    @classmethod
+    def __create_typed_node(cls, plan: dict) -> "PlanNode":
+        """
+        Create the node subclass of the plan's node type
+        :param plan: QEP from PostgresSQL
+        :return:
+        """
         node_type = plan["Node Type"]
         cost = plan["Total Cost"]
         rows = plan.get("Plan Rows", 0)
@@ -81,10 +184,45 @@ class PlanNode:
             return HashJoinNode(cost=cost, row=rows, cond=plan.get("Hash Cond", ""))
         elif node_type == "Merge Join":
             return MergeJoinNode(cost=cost, row=rows, cond=plan.get("Merge Cond", ""))
+        elif node_type == "Index Only Scan":
+            return IndexOnlyScanNode(
+                cost=cost,
+                row=rows,
+                table_name=plan.get("Relation Name", "None"),
+                cond=plan.get("Index Cond", plan.get("Filter", ""))
+            )
+        elif node_type == "Tid Scan":
+            return TidScanNode(
+                cost=cost,
+                row=rows,
+                table_name=plan.get("Relation Name", "None"),
+                cond=plan.get("TID Cond", "")
+            )
         elif node_type == "Aggregate":
             group_key = plan["Group Key"] if "Group Key" in plan else "None"
+            if plan.get("Strategy") in ("Hashed", "Mixed"):
+                return HashAggregateNode(cost=cost, row=rows, group_keys=group_key)
             return AggregateNode(cost=cost, row=rows, group_keys=group_key)
+        elif node_type == "Incremental Sort":
+            return IncrementalSortNode(
+                cost=cost,
+                row=rows,
+                sort_keys=plan.get("Sort Key", "None"),
+                presorted_keys=plan.get("Presorted Key", "None")
+            )
+        elif node_type == "Materialize":
+            return MaterializeNode(cost=cost, row=rows)
+        elif node_type == "Memoize":
+            return MemoizeNode(cost=cost, row=rows, cache_keys=plan.get("Cache Key", "None"))
+        elif node_type == "Append":
+            if plan.get("Parallel Aware"):
+                return ParallelAppendNode(cost=cost, row=rows, subplans_removed=plan.get("Subplans Removed", 0))
+            return AppendNode(cost=cost, row=rows, subplans_removed=plan.get("Subplans Removed", 0))
+        elif node_type == "Gather Merge":
+            return GatherMergeNode(cost=cost, row=rows, workers=plan.get("Workers Planned", 0))
         elif node_type == "Hash":
+            if plan.get("Parallel Aware"):
+                return ParallelHashNode(cost=cost, row=rows)
             return HashNode(cost=cost, row=rows)
         elif node_type == "Nested Loop":
             return NestedLoop(cost=cost, row=rows)
@@ -100,76 +238,62 @@ class PlanNode:
         :param root: The root node
         :return: list of node types
         """
-        lst = set()
+        return list({n.type for n, _, _ in preorder(root)})
 
-        def dfs(n: "PlanNode"):
-            lst.add(n.type)
-            for item in n.children:
-                dfs(item)
+    @classmethod
+    def get_signature(cls, root: "PlanNode") -> tuple:
+        """
+        Get the structure of a plan tree, structurally identical plans have equal signatures
+        The signature is flat, so that comparing and hashing it does not recurse however deep the plan is
+        :param root: The root node
+        :return: tuple of (node type, relation name, number of children) of every node, in pre-order
+        """
+        return tuple((n.type, getattr(n, "table_name", None), len(n.children)) for n, _, _ in preorder(root))
 
-        dfs(root)
-        return list(lst)
+    @classmethod
+    def to_dict(cls, root: "PlanNode") -> dict:
+        """
+        Convert a plan tree to plain dicts, e.g. to write it as JSON
+        :param root: The root node
+        :return: nested dict of the node type, cost, rows, diff mark, annotations, actual statistics if any,
+                 and children
+        """
+        dicts = {}
+        for n in postorder(root):
+            d = {
+                "type": n.type,
+                "cost": n.cost,
+                "rows": n.rows,
+                "is_diff": n.is_diff,
+                "annotations": n.get_annotation_text(),
+            }
+            if n.loops is not None:
+                d["actual_time"] = n.actual_time
+                d["actual_rows"] = n.actual_rows
+                d["loops"] = n.loops
+            d["children"] = [dicts.pop(c) for c in n.children]
+            dicts[n] = d
+        return dicts[root]
 
     @classmethod
-    def compare_trees(cls, org: "PlanNode", alt: "PlanNode"):
+    def compare_trees(cls, org: "PlanNode", alt: "PlanNode") -> PlanDiff:
         """
-        Compare 2 trees, mark a node if it's different from the first
+        Compare 2 trees, mark the nodes of the second that are inserted, relabelled or moved compared to the first
+        Identical subtrees are matched wherever they are, so e.g. swapped join sides only mark the moved inputs
+        :param org: Root of the original plan
+        :param alt: Root of the alternative plan
+        :return: The differences, see plan_diff.PlanDiff
         """
-        def dfs_mark(node):
-            """
-            Mark all child as diff
-            """
+        diff = diff_trees(org, alt)
+        for _, node in diff.matched:
+            node.is_diff = False
+        for node in diff.changed_nodes():
             node.is_diff = True
-            for n in node.children:
-                dfs_mark(n)
-
-        def dfs_compare(node1, node2):
-            """
-            Compare two trees recursively
-            """
-            if not node1 and node2:
-                # node 2 must be all diff below
-                dfs_mark(node2)
-
-            if node1 and not node2:
-                # nth to compare
-                return
-
-            if not node1 and not node2:
-                # nth to compare
-                return
-
-            if node1.type != node2.type:
-                # Diff
-                dfs_mark(node2)
-            else:
-                if len(node1.children) == 2:
-                    left1 = node1.children[0]
-                    left2 = node1.children[1]
-                elif len(node1.children) == 1:
-                    left1 = node1.children[0]
-                    left2 = None
-                else:
-                    left1 = None
-                    left2 = None
-
-                if len(node2.children) == 2:
-                    right1 = node2.children[0]
-                    right2 = node2.children[1]
-                elif len(node2.children) == 1:
-                    right1 = node2.children[0]
-                    right2 = None
-                else:
-                    right1 = None
-                    right2 = None
-
-                dfs_compare(left1, right1)
-                dfs_compare(left2, right2)
-
-        dfs_compare(org, alt)
+        return diff
 
 
 class SortNode(PlanNode):
+    __slots__ = ("sort_keys",)
     type = "Sort"
 
     def __init__(self, cost: float, row: int, sort_keys: list):
@@ -188,6 +312,7 @@ class SortNode(PlanNode):
 
 
 class SeqScanNode(PlanNode):
+    __slots__ = ("table_name", "q_filter")
     type = "Seq Scan"
 
     def __init__(self, cost: float, row: int, table_name: str, q_filter: str):
@@ -207,6 +332,7 @@ class SeqScanNode(PlanNode):
 
 
 class IndexScanNode(PlanNode):
+    __slots__ = ("table_name", "cond")
     type = "Index Scan"
 
     def __init__(self, cost: float, row: int, table_name: str, cond: str):
@@ -226,6 +352,7 @@ class IndexScanNode(PlanNode):
 
 
 class BitMapHeapScanNode(PlanNode):
+    __slots__ = ("table_name",)
     type = "Bitmap Heap Scan"
 
     def __init__(self, cost: float, row: int, table_name: str):
@@ -243,6 +370,7 @@ class BitMapHeapScanNode(PlanNode):
 
 
 class HashJoinNode(PlanNode):
+    __slots__ = ("cond",)
     type = "Hash Join"
 
     def __init__(self, cost: float, row: int, cond: str):
@@ -260,6 +388,7 @@ class HashJoinNode(PlanNode):
 
 
 class MergeJoinNode(PlanNode):
+    __slots__ = ("cond",)
     type = "Merge Join"
 
     def __init__(self, cost: float, row: int, cond: str):
@@ -277,6 +406,7 @@ class MergeJoinNode(PlanNode):
 
 
 class AggregateNode(PlanNode):
+    __slots__ = ("group_keys",)
     type = "Aggregate"
 
     def __init__(self, cost: float, row: int, group_keys: list):
@@ -294,6 +424,7 @@ class AggregateNode(PlanNode):
 
 
 class HashNode(PlanNode):
+    __slots__ = ()
     type = "Hash"
 
     def __init__(self, cost: float, row: int):
@@ -309,6 +440,7 @@ class HashNode(PlanNode):
 
 
 class NestedLoop(PlanNode):
+    __slots__ = ()
     type = "Nested Loop"
 
     def __init__(self, cost: float, row: int):
@@ -324,6 +456,7 @@ class NestedLoop(PlanNode):
 
 
 class LimitNode(PlanNode):
+    __slots__ = ()
     type = "Limit"
 
     def __init__(self, cost: float, row: int):
@@ -338,8 +471,165 @@ class LimitNode(PlanNode):
         return text
 
 
+class IndexOnlyScanNode(PlanNode):
+    __slots__ = ("table_name", "cond")
+    type = "Index Only Scan"
+
+    def __init__(self, cost: float, row: int, table_name: str, cond: str):
+        """
+        Index Only Scan node
+        :param cost: Total cost
+        :param table_name: The table name the scan is run on
+        :param cond: The condition of the scan is run on
+        """
+        super().__init__(cost, row)
+        self.table_name = table_name
+        self.cond = cond
+
+    def get_annotations(self) -> str:
+        text = index_only_scan_annotation(self.table_name, self.cond)
+        return text
+
+
+class TidScanNode(PlanNode):
+    __slots__ = ("table_name", "cond")
+    type = "Tid Scan"
+
+    def __init__(self, cost: float, row: int, table_name: str, cond: str):
+        """
+        TID Scan node
+        :param cost: Total cost
+        :param table_name: The table name the scan is run on
+        :param cond: The condition on the row locations
+        """
+        super().__init__(cost, row)
+        self.table_name = table_name
+        self.cond = cond
+
+    def get_annotations(self) -> str:
+        text = tid_scan_annotation(self.table_name, self.cond)
+        return text
+
+
+class HashAggregateNode(AggregateNode):
+    __slots__ = ()
+    type = "HashAggregate"
+
+    def get_annotations(self) -> str:
+        text = hash_aggregate_annotation(self.group_keys)
+        return text
+
+
+class IncrementalSortNode(PlanNode):
+    __slots__ = ("sort_keys", "presorted_keys")
+    type = "Incremental Sort"
+
+    def __init__(self, cost: float, row: int, sort_keys: list, presorted_keys: list):
+        """
+        Incremental Sort node
+        :param cost: Total cost
+        :param sort_keys: list of sort keys
+        :param presorted_keys: list of the leading sort keys the input is already sorted on
+        """
+        super().__init__(cost, row)
+        self.sort_keys = sort_keys
+        self.presorted_keys = presorted_keys
+
+    def get_annotations(self) -> str:
+        text = incremental_sort_annotation(self.sort_keys, self.presorted_keys)
+        return text
+
+
+class MaterializeNode(PlanNode):
+    __slots__ = ()
+    type = "Materialize"
+
+    def __init__(self, cost: float, row: int):
+        """
+        Materialize node
+        :param cost: Total cost
+        """
+        super().__init__(cost, row)
+
+    def get_annotations(self) -> str:
+        text = materialize_annotation()
+        return text
+
+
+class MemoizeNode(PlanNode):
+    __slots__ = ("cache_keys",)
+    type = "Memoize"
+
+    def __init__(self, cost: float, row: int, cache_keys: list):
+        """
+        Memoize node
+        :param cost: Total cost
+        :param cache_keys: The keys the cached rows are looked up by
+        """
+        super().__init__(cost, row)
+        self.cache_keys = cache_keys
+
+    def get_annotations(self) -> str:
+        text = memoize_annotation(self.cache_keys)
+        return text
+
+
+class AppendNode(PlanNode):
+    __slots__ = ("subplans_removed",)
+    type = "Append"
+
+    def __init__(self, cost: float, row: int, subplans_removed: int):
+        """
+        Append node
+        :param cost: Total cost
+        :param subplans_removed: Number of subplans pruned when the plan is run
+        """
+        super().__init__(cost, row)
+        self.subplans_removed = subplans_removed
+
+    def get_annotations(self) -> str:
+        text = append_annotation(len(self.children), self.subplans_removed)
+        return text
+
+
+class ParallelAppendNode(AppendNode):
+    __slots__ = ()
+    type = "Parallel Append"
+
+    def get_annotations(self) -> str:
+        text = parallel_append_annotation(len(self.children), self.subplans_removed)
+        return text
+
+
+class ParallelHashNode(HashNode):
+    __slots__ = ()
+    type = "Parallel Hash"
+
+    def get_annotations(self) -> str:
+        text = parallel_hash_annotation()
+        return text
+
+
+class GatherMergeNode(PlanNode):
+    __slots__ = ("workers",)
+    type = "Gather Merge"
+
+    def __init__(self, cost: float, row: int, workers: int):
+        """
+        Gather Merge node
+        :param cost: Total cost
+        :param workers: Number of parallel workers planned
+        """
+        super().__init__(cost, row)
+        self.workers = workers
+
+    def get_annotations(self) -> str:
+        text = gather_merge_annotation(self.workers)
+        return text
+
+
 class UndefinedNode(PlanNode):
-    type = "Undefined Node"
+    __slots__ = ("type_name",)
 
     def __init__(self, cost: float, row: int, type_name: str = "Undefined Node"):
         """
@@ -347,7 +637,11 @@ class UndefinedNode(PlanNode):
         :param cost: Total cost
         """
         super().__init__(cost, row)
-        self.type = type_name
+        self.type_name = type_name
+
+    @property
+    def type(self) -> str:
+        return self.type_name
 
     def get_annotations(self) -> str:
         return ""
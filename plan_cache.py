@@ -0,0 +1,132 @@
+import re
+import threading
+from collections import OrderedDict
+
+# Tokens of SQL text that are not plain SQL: comments, quoted literals and identifiers, and statement separators.
+# Escape strings (E'...', with backslash escapes), dollar-quoted strings ($$...$$ or $tag$...$tag$), standard strings
+# and quoted identifiers. Matched left to right, so quotes in comments and comment marks in quotes are not tokens
+sql_token_pattern = re.compile(
+    r"--[^\n]*"
+    r"|/\*.*?\*/"
+    r"|(?<![\w$])[eE]'(?:[^'\\]|\\.|'')*'"
+    r"|(?<![\w$])\$(?P<tag>(?:[^\W\d]\w*)?)\$.*?\$(?P=tag)\$"
+    r"|'(?:[^']|'')*'"
+    r"|\"(?:[^\"]|\"\")*\""
+    r"|;",
+    re.DOTALL
+)
+
+
+def normalize_sql(sql_query: str) -> str:
+    """
+    Normalize a SQL query so that formatting differences map to the same cache key
+    Whitespace is collapsed and unquoted text is lower-cased, quoted text is left untouched.
+    Line comments are dropped, block comments are kept verbatim as they may hold planner hints
+    :param sql_query: The SQL query
+    :return: The normalized query
+    """
+    parts = []
+    plain = []  # Plain text since the last token kept
+    end = 0
+    for match in sql_token_pattern.finditer(sql_query):
+        token = match.group()
+        if token == ";":
+            continue  # Plain text
+        plain.append(sql_query[end:match.start()])
+        end = match.end()
+        if token.startswith("--"):
+            plain.append(" ")
+            continue
+        parts.append(re.sub(r"\s+", " ", "".join(plain)).lower())
+        parts.append(token)
+        plain = []
+    plain.append(sql_query[end:])
+    parts.append(re.sub(r"\s+", " ", "".join(plain)).lower())
+
+    return "".join(parts).strip(" ;")
+
+
+def make_plan_key(sql_query: str, off_list: list, settings: dict) -> tuple:
+    """
+    Build the cache key of a plan
+    :param sql_query: The SQL query
+    :param off_list: List of operations turned off
+    :param settings: Other planner settings applied to the plan
+    :return: The cache key
+    """
+    return normalize_sql(sql_query), tuple(sorted(off_list)), tuple(sorted(settings.items()))
+
+
+class PlanCache:
+    """
+    Bounded in-process plan cache with LRU eviction
+    Stores the raw plan JSON, plan trees are rebuilt on every hit as they get marked by compare_trees
+    """
+
+    def __init__(self, max_size: int = 128):
+        """
+        Init plan cache
+        :param max_size: Max number of plans kept, 0 disables the cache
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__plans = OrderedDict()
+        self.__lock = threading.Lock()  # Plans are looked up from the planner's worker threads in pooled mode
+
+    def __len__(self):
+        return len(self.__plans)
+
+    def get(self, key: tuple):
+        """
+        Look up a plan, marking it as most recently used
+        :param key: Key from make_plan_key
+        :return: The raw plan, None on a miss
+        """
+        with self.__lock:
+            plan = self.__plans.get(key)
+            if plan is None:
+                self.misses += 1
+                return None
+
+            self.__plans.move_to_end(key)
+            self.hits += 1
+            return plan
+
+    def put(self, key: tuple, plan) -> None:
+        """
+        Store a plan, evicting the least recently used plans when full
+        :param key: Key from make_plan_key
+        :param plan: The raw plan
+        :return: None
+        """
+        if self.max_size <= 0:
+            return
+
+        with self.__lock:
+            self.__plans[key] = plan
+            self.__plans.move_to_end(key)
+            while len(self.__plans) > self.max_size:
+                self.__plans.popitem(last=False)
+
+    def invalidate(self, sql_query: str = None) -> None:
+        """
+        Drop cached plans
+        :param sql_query: Only drop the plans of this query, drops everything if not given
+        :return: None
+        """
+        with self.__lock:
+            if sql_query is None:
+                self.__plans.clear()
+                return
+
+            normalized = normalize_sql(sql_query)
+            for key in [k for k in self.__plans if k[0] == normalized]:
+                del self.__plans[key]
+
+    def stats(self) -> dict:
+        """
+        Get the cache statistics
+        :return: dict of hits, misses and size
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.__plans)}
@@ -0,0 +1,188 @@
+from tkinter import *
+
+from node import PlanNode
+from plan_walk import preorder
+
+NODE_WIDTH = 130
+NODE_HEIGHT = 30
+H_GAP = 16  # Space between sibling subtrees
+V_GAP = 36  # Space between levels
+MARGIN = 60
+HEAT_COLOR = (0xD3, 0x2F, 0x2F)  # Fill of the most expensive node in a heat map, the cheapest are white
+DIFF_DASH = (6, 3)  # Outline of the diff nodes in a heat map, as their fill shows the heat instead
+
+
+def heat_color(heat: float) -> str:
+    """
+    Get the fill of a node in a cost heat map
+    :param heat: How expensive the node is, from 0 to 1
+    :return: Color from white to HEAT_COLOR
+    """
+    r, g, b = (round(255 + (c - 255) * heat) for c in HEAT_COLOR)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def layout_tree(root: PlanNode) -> list:
+    """
+    Compute the tree layout of a plan
+    Leaves take consecutive slots from left to right and parents are centered above their children,
+    so subtrees never overlap and the layout is linear in the number of nodes
+    :param root: The root node
+    :return: list of (node, x, y, parent index) in pre-order, x and y are the box centers relative to the root
+    """
+    nodes = []
+    parents = []
+    depths = []
+    xs = []
+    first_child = []
+    last_child = []
+    index_of = {}
+    next_leaf = 0
+    for node, parent, depth in preorder(root):
+        index = len(nodes)
+        index_of[node] = index
+        parent_index = index_of[parent] if parent is not None else -1
+        nodes.append(node)
+        parents.append(parent_index)
+        depths.append(depth)
+        first_child.append(-1)
+        last_child.append(-1)
+        if parent_index >= 0:
+            if first_child[parent_index] < 0:
+                first_child[parent_index] = index
+            last_child[parent_index] = index
+
+        # Leaves come in left to right order
+        if node.children:
+            xs.append(0)
+        else:
+            xs.append(next_leaf * (NODE_WIDTH + H_GAP))
+            next_leaf += 1
+
+    # Children come after their parent in pre-order, walking backwards places them first
+    for index in range(len(nodes) - 1, -1, -1):
+        if first_child[index] >= 0:
+            xs[index] = (xs[first_child[index]] + xs[last_child[index]]) / 2
+
+    return [(nodes[i], xs[i], depths[i] * (NODE_HEIGHT + V_GAP), parents[i]) for i in range(len(nodes))]
+
+
+class PlanCanvas:
+    """
+    Draws a whole plan tree on a single Canvas
+    Every node is a rectangle tagged "node" and "node<index>", hovering and clicking are resolved from the tags
+    of the current item
+    """
+
+    def __init__(self, canvas: Canvas, root: PlanNode, on_enter=None, on_leave=None, on_click=None,
+                 outlines: dict = None, fills: dict = None):
+        """
+        Draw the plan
+        :param canvas: The canvas to draw on, its scroll region is set to the plan
+        :param root: The root node
+        :param outlines: Outline color of the highlighted nodes, by node
+        :param fills: Fill color of the nodes, by node, instead of marking the diff nodes red, they are dashed then
+        :param on_enter: Called with (node, event) when the mouse enters a node
+        :param on_leave: Called with (node, event) when the mouse leaves a node
+        :param on_click: Called with (node, event) when a node is clicked, after it's selected
+        """
+        self.canvas = canvas
+        self.on_enter = on_enter
+        self.on_leave = on_leave
+        self.on_click = on_click
+        self.outlines = outlines or {}
+        self.fills = fills
+        self.nodes = []
+        self.selected = None  # Index of the selected node
+
+        self.draw(root)
+        canvas.tag_bind("node", "<Enter>", self.__enter)
+        canvas.tag_bind("node", "<Leave>", self.__leave)
+        canvas.tag_bind("node", "<Button-1>", self.__click)
+
+    def draw(self, root: PlanNode) -> None:
+        """
+        Draw the plan, centered horizontally when it is narrower than the canvas
+        :param root: The root node
+        """
+        canvas = self.canvas
+        canvas.delete("node", "label", "edge")
+        positions = layout_tree(root)
+        self.nodes = [node for node, _, _, _ in positions]
+        self.selected = None
+
+        tree_width = max(x for _, x, _, _ in positions) + NODE_WIDTH
+        offset_x = max(MARGIN, (int(canvas.cget("width")) - tree_width) / 2) + NODE_WIDTH / 2
+        offset_y = MARGIN + NODE_HEIGHT / 2
+
+        half_w = NODE_WIDTH / 2
+        half_h = NODE_HEIGHT / 2
+        for index, (node, x, y, parent) in enumerate(positions):
+            x += offset_x
+            y += offset_y
+            if parent >= 0:
+                _, px, py, _ = positions[parent]
+                canvas.create_line(px + offset_x, py + offset_y + half_h, x, y - half_h, tags="edge")
+
+            # change node color if the node is "is_diff"
+            if self.fills is not None:
+                box_bg, box_fg = self.fills.get(node, "white"), "black"
+            elif node.is_diff:
+                box_bg, box_fg = "red", "white"
+            else:
+                box_bg, box_fg = "white", "black"
+
+            canvas.create_rectangle(x - half_w, y - half_h, x + half_w, y + half_h, fill=box_bg,
+                                    tags=("node", f"node{index}"), **self.__outline(node))
+            # Disabled text is never the current item, the mouse stays over the box while crossing the text
+            canvas.create_text(x, y, text=node.type, fill=box_fg, width=NODE_WIDTH - 6, justify=CENTER,
+                               state=DISABLED, tags="label")
+
+        x1, y1, x2, y2 = canvas.bbox("all")
+        canvas.configure(scrollregion=(min(x1, 0), min(y1, 0), x2 + MARGIN, y2 + MARGIN))
+
+    def __outline(self, node: PlanNode) -> dict:
+        """
+        Get the outline options of a node box when not selected
+        :param node: The node
+        :return: dict of outline, width and dash
+        """
+        color = self.outlines.get(node)
+        options = {"outline": color, "width": 3} if color else {"outline": "black", "width": 1}
+        if self.fills is not None and node.is_diff:
+            options.update(dash=DIFF_DASH, width=max(options["width"], 2))
+        return options
+
+    def __current_node(self):
+        """
+        Find the node under the mouse from the tags of the current item
+        :return: (index, node), None if not over a node
+        """
+        for tag in self.canvas.gettags("current"):
+            if tag.startswith("node") and tag != "node":
+                index = int(tag[4:])
+                return index, self.nodes[index]
+        return None
+
+    def __enter(self, event):
+        current = self.__current_node()
+        if current and self.on_enter:
+            self.on_enter(current[1], event)
+
+    def __leave(self, event):
+        current = self.__current_node()
+        if current and self.on_leave:
+            self.on_leave(current[1], event)
+
+    def __click(self, event):
+        current = self.__current_node()
+        if not current:
+            return
+
+        index, node = current
+        if self.selected is not None:
+            self.canvas.itemconfigure(f"node{self.selected}", **self.__outline(self.nodes[self.selected]))
+        self.selected = index
+        self.canvas.itemconfigure(f"node{index}", outline="#3B86A7", width=3)
+        if self.on_click:
+            self.on_click(node, event)
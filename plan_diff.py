@@ -0,0 +1,400 @@
+from bisect import bisect_left
+from collections import defaultdict, deque
+
+from plan_walk import paired_walk, preorder
+
+# Pruned trees needing more forest distance cells than this are matched greedily instead of by tree edit distance.
+# A cell takes about 0.5 us, so the edit distance of a region stays under about 50 ms
+ted_limit = 100000
+
+
+def node_label(node) -> tuple:
+    """
+    Get the label of a node, nodes with different labels are different operations
+    :param node: The node
+    :return: (node type, relation name)
+    """
+    return node.type, getattr(node, "table_name", None)
+
+
+class IndexedTree:
+    """
+    Plan tree flattened in pre-order, nodes are referred to by their index
+    """
+
+    def __init__(self, root):
+        self.nodes = []
+        self.parent = []
+        self.children = []
+
+        index_of = {}
+        for node, parent, _ in preorder(root):
+            index = len(self.nodes)
+            index_of[node] = index
+            parent_index = index_of[parent] if parent is not None else -1
+            self.nodes.append(node)
+            self.parent.append(parent_index)
+            self.children.append([])
+            if parent_index >= 0:
+                self.children[parent_index].append(index)
+
+        self.labels = [node_label(node) for node in self.nodes]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def structure_ids(self, table: dict) -> tuple:
+        """
+        Number every subtree by its structure, identical subtrees get the same id from the same table
+        Children come after their parent in pre-order, so walking backwards sees them first
+        :param table: Ids of the structures seen so far, shared by the trees being compared
+        :return: (list of ids, list of subtree sizes)
+        """
+        ids = [0] * len(self.nodes)
+        sizes = [1] * len(self.nodes)
+        for i in range(len(self.nodes) - 1, -1, -1):
+            children = self.children[i]
+            key = (self.labels[i], tuple(ids[c] for c in children))
+            ids[i] = table.setdefault(key, len(table))
+            for c in children:
+                sizes[i] += sizes[c]
+        return ids, sizes
+
+
+class PlanDiff:
+    """
+    Differences between an original plan and an alternative plan
+    """
+
+    def __init__(self):
+        self.matched = []  # (original node, alternative node) of unchanged operations
+        self.relabelled = []  # (original node, alternative node) of operations replaced by another one
+        self.moved = []  # (original node, alternative node) of the same operations under another parent or order
+        self.inserted = []  # Alternative nodes not in the original plan
+        self.deleted = []  # Original nodes not in the alternative plan
+        self.exact = True  # False if the unmatched part was too big for the tree edit distance
+
+    @property
+    def distance(self) -> int:
+        """
+        Number of edit operations turning the original plan into the alternative plan
+        """
+        return len(self.relabelled) + len(self.moved) + len(self.inserted) + len(self.deleted)
+
+    def changed_nodes(self) -> list:
+        """
+        Get the alternative nodes that differ from the original plan
+        :return: list of nodes
+        """
+        return self.inserted + [alt for _, alt in self.relabelled] + [alt for _, alt in self.moved]
+
+
+def diff_trees(org, alt) -> PlanDiff:
+    """
+    Diff two plan trees
+    Identical subtrees are matched wherever they are by their structure ids, largest first. What is left is
+    matched by the tree edit distance of the remaining nodes, with every matched subtree standing in as a leaf
+    :param org: Root of the original plan
+    :param alt: Root of the alternative plan
+    :return: The differences
+    """
+    tree_a = IndexedTree(org)
+    tree_b = IndexedTree(alt)
+    table = {}
+    ids_a, _ = tree_a.structure_ids(table)
+    ids_b, sizes_b = tree_b.structure_ids(table)
+
+    match_a = [-1] * len(tree_a)
+    match_b = [-1] * len(tree_b)
+
+    # Identical subtrees, a larger subtree is always matched before the subtrees it contains
+    candidates = defaultdict(deque)
+    for i, structure in enumerate(ids_a):
+        candidates[structure].append(i)
+
+    subtree_roots = []
+    for b in sorted(range(len(tree_b)), key=lambda i: -sizes_b[i]):
+        if match_b[b] >= 0:
+            continue
+        queue = candidates.get(ids_b[b])
+        while queue and match_a[queue[0]] >= 0:
+            queue.popleft()
+        if not queue:
+            continue
+
+        a = queue.popleft()
+        subtree_roots.append((a, b))
+        for x, y in paired_walk(a, b, tree_a.children.__getitem__, tree_b.children.__getitem__):
+            match_a[x] = y
+            match_b[y] = x
+
+    # Follow the unmatched nodes down from the roots while both plans keep the same shape, the edit distance
+    # is only needed below the nodes where they stop agreeing
+    diff = PlanDiff()
+    pairs = []
+    regions = []
+    stack = [(0, 0)] if match_a[0] < 0 and match_b[0] < 0 else []
+    while stack:
+        a, b = stack.pop()
+        children_a, children_b = tree_a.children[a], tree_b.children[b]
+        if tree_a.labels[a] == tree_b.labels[b] and len(children_a) == len(children_b) and all(
+                match_a[x] == y or (match_a[x] < 0 and match_b[y] < 0 and tree_a.labels[x] == tree_b.labels[y])
+                for x, y in zip(children_a, children_b)):
+            pairs.append((a, b))
+            stack.extend((x, y) for x, y in zip(children_a, children_b) if match_a[x] < 0)
+        else:
+            regions.append((a, b))
+    if match_a[0] >= 0 or match_b[0] >= 0:
+        regions.append((0, 0))
+
+    roots_a = {a for a, _ in subtree_roots}
+    roots_b = {b for _, b in subtree_roots}
+    for a, b in regions:
+        pruned_a = pruned_postorder(tree_a, a, roots_a)
+        pruned_b = pruned_postorder(tree_b, b, roots_b)
+        if keyroot_work(pruned_a) * keyroot_work(pruned_b) <= ted_limit:
+            pairs.extend(edit_mapping(tree_a, tree_b, pruned_a, pruned_b, match_a, match_b))
+        else:
+            pairs.extend(greedy_mapping(tree_a, tree_b, match_a, match_b, a, b))
+            diff.exact = False
+
+    for a, b in pairs:
+        match_a[a] = b
+        match_b[b] = a
+        if tree_a.labels[a] != tree_b.labels[b]:
+            diff.relabelled.append((tree_a.nodes[a], tree_b.nodes[b]))
+
+    moved = find_moves(tree_a, tree_b, match_a, match_b)
+    for b, a in enumerate(match_b):
+        if a < 0:
+            diff.inserted.append(tree_b.nodes[b])
+        elif tree_a.labels[a] != tree_b.labels[b]:
+            continue  # Listed as relabelled only, even if also moved, so that every node is listed once
+        elif b in moved:
+            diff.moved.append((tree_a.nodes[a], tree_b.nodes[b]))
+        else:
+            diff.matched.append((tree_a.nodes[a], tree_b.nodes[b]))
+    diff.deleted = [tree_a.nodes[a] for a, b in enumerate(match_a) if b < 0]
+    return diff
+
+
+def pruned_postorder(tree: IndexedTree, root: int, subtree_roots: set) -> tuple:
+    """
+    List the nodes of a subtree left after collapsing every matched subtree into its root, in post-order
+    :param tree: The tree
+    :param root: Root of the subtree
+    :param subtree_roots: Roots of the matched subtrees
+    :return: (list of node indexes, list of the post-order position of the leftmost leaf of each node)
+    """
+    order = []
+    leftmost = []
+    stack = [(root, False)]
+    first_leaf = {}  # Post-order position of the leftmost leaf, by node index
+    while stack:
+        i, visited = stack.pop()
+        children = [] if i in subtree_roots else tree.children[i]
+        if visited or not children:
+            position = len(order)
+            order.append(i)
+            leftmost.append(first_leaf[children[0]] if children else position)
+            first_leaf[i] = leftmost[-1]
+        else:
+            stack.append((i, True))
+            for c in reversed(children):
+                stack.append((c, False))
+    return order, leftmost
+
+
+def keyroots(leftmost: list) -> list:
+    """
+    Get the keyroots of a tree, the nodes that have no ancestor sharing their leftmost leaf
+    :param leftmost: Post-order position of the leftmost leaf of each node, see pruned_postorder
+    :return: list of post-order positions, ascending
+    """
+    return sorted({l: i for i, l in enumerate(leftmost)}.values())
+
+
+def keyroot_work(pruned: tuple) -> int:
+    """
+    Get how much of a tree the edit distance goes through, the sizes of its keyroot subtrees summed.
+    The forest distance cells computed for two trees are the product of their work
+    :param pruned: (post-order, leftmost leaves) of the tree, see pruned_postorder
+    :return: The work
+    """
+    _, leftmost = pruned
+    return sum(i - leftmost[i] + 1 for i in keyroots(leftmost))
+
+
+def edit_mapping(tree_a: IndexedTree, tree_b: IndexedTree, pruned_a: tuple, pruned_b: tuple, match_a: list,
+                 match_b: list) -> list:
+    """
+    Map the unmatched nodes by the Zhang-Shasha tree edit distance of the pruned trees
+    A matched subtree only maps to its partner, unmatched nodes map to nodes of the same label at no cost
+    and to other nodes as a relabelling
+    :return: list of (original index, alternative index) of the newly mapped nodes
+    """
+    order_a, lmd_a = pruned_a
+    order_b, lmd_b = pruned_b
+    na, nb = len(order_a), len(order_b)
+    tree_dist = [[0] * nb for _ in range(na)]
+
+    def cost(i, j):
+        a, b = order_a[i], order_b[j]
+        if match_a[a] >= 0 or match_b[b] >= 0:
+            return 0 if match_a[a] == b else 2  # Never cheaper than deleting and inserting
+        return 0 if tree_a.labels[a] == tree_b.labels[b] else 1
+
+    def forest_dist(i, j):
+        li, lj = lmd_a[i], lmd_b[j]
+        m, n = i - li + 2, j - lj + 2
+        fd = [[0] * n for _ in range(m)]
+        for x in range(1, m):
+            fd[x][0] = x
+        for y in range(1, n):
+            fd[0][y] = y
+        for x in range(1, m):
+            i1 = li + x - 1
+            row, prev = fd[x], fd[x - 1]
+            for y in range(1, n):
+                j1 = lj + y - 1
+                if lmd_a[i1] == li and lmd_b[j1] == lj:
+                    d = min(prev[y] + 1, row[y - 1] + 1, prev[y - 1] + cost(i1, j1))
+                    tree_dist[i1][j1] = d
+                else:
+                    d = min(prev[y] + 1, row[y - 1] + 1,
+                            fd[lmd_a[i1] - li][lmd_b[j1] - lj] + tree_dist[i1][j1])
+                row[y] = d
+        return fd
+
+    keyroots_b = keyroots(lmd_b)
+    for i in keyroots(lmd_a):
+        for j in keyroots_b:
+            forest_dist(i, j)
+
+    # Walk the forest distances back from the roots to recover the mapping
+    pairs = []
+    stack = [(na - 1, nb - 1)]
+    while stack:
+        i, j = stack.pop()
+        fd = forest_dist(i, j)
+        li, lj = lmd_a[i], lmd_b[j]
+        x, y = i - li + 1, j - lj + 1
+        while x > 0 and y > 0:
+            i1, j1 = li + x - 1, lj + y - 1
+            if lmd_a[i1] == li and lmd_b[j1] == lj:
+                if fd[x][y] == fd[x - 1][y - 1] + cost(i1, j1):
+                    pairs.append((i1, j1))
+                    x, y = x - 1, y - 1
+                    continue
+            else:
+                p, q = lmd_a[i1] - li, lmd_b[j1] - lj
+                if fd[x][y] == fd[p][q] + tree_dist[i1][j1]:
+                    stack.append((i1, j1))
+                    x, y = p, q
+                    continue
+            if fd[x][y] == fd[x - 1][y] + 1:
+                x -= 1
+            else:
+                y -= 1
+
+    # Matched subtrees are already mapped
+    return [(order_a[i], order_b[j]) for i, j in pairs if match_a[order_a[i]] < 0 and match_b[order_b[j]] < 0]
+
+
+def greedy_mapping(tree_a: IndexedTree, tree_b: IndexedTree, match_a: list, match_b: list, root_a: int,
+                   root_b: int) -> list:
+    """
+    Map the unmatched nodes of two subtrees top-down, starting from their roots: the unmatched children of mapped
+    nodes are mapped to a child of the same label if any, then to the remaining children in order
+    :return: list of (original index, alternative index) of the newly mapped nodes
+    """
+    if match_a[root_a] >= 0 or match_b[root_b] >= 0:
+        return []
+    pairs = [(root_a, root_b)]
+    queue = deque(pairs)
+    used_a = set()
+    while queue:
+        a, b = queue.popleft()
+        free_a = [c for c in tree_a.children[a] if match_a[c] < 0 and c not in used_a]
+        free_b = [c for c in tree_b.children[b] if match_b[c] < 0]
+        leftover_b = []
+        for c in free_b:
+            same = next((x for x in free_a if tree_a.labels[x] == tree_b.labels[c]), None)
+            if same is None:
+                leftover_b.append(c)
+            else:
+                free_a.remove(same)
+                pairs.append((same, c))
+                used_a.add(same)
+                queue.append((same, c))
+        for x, c in zip(free_a, leftover_b):
+            pairs.append((x, c))
+            used_a.add(x)
+            queue.append((x, c))
+    return pairs
+
+
+def find_moves(tree_a: IndexedTree, tree_b: IndexedTree, match_a: list, match_b: list) -> set:
+    """
+    Find the mapped alternative nodes that moved: their closest mapped ancestor is not mapped to the closest
+    mapped ancestor of their original node, or they are out of order among their mapped siblings
+    :return: set of alternative node indexes
+    """
+    anc_a = closest_mapped_ancestors(tree_a, match_a)
+    anc_b = closest_mapped_ancestors(tree_b, match_b)
+
+    moved = set()
+    siblings = defaultdict(list)  # Mapped nodes under the same mapped ancestor, in alternative pre-order
+    for b, a in enumerate(match_b):
+        if a < 0:
+            continue
+        parent_b = anc_b[b]
+        expected = match_b[parent_b] if parent_b >= 0 else -1
+        if expected != anc_a[a]:
+            moved.add(b)
+        else:
+            siblings[parent_b].append((b, a))
+
+    for group in siblings.values():
+        # Nodes outside the longest run kept in the original order have been reordered
+        kept = longest_increasing([a for _, a in group])
+        moved.update(b for k, (b, _) in enumerate(group) if k not in kept)
+    return moved
+
+
+def closest_mapped_ancestors(tree: IndexedTree, match: list) -> list:
+    """
+    Find the closest mapped proper ancestor of every node
+    :return: list of node indexes, -1 if none
+    """
+    ancestors = [-1] * len(tree)
+    for i in range(1, len(tree)):
+        parent = tree.parent[i]
+        ancestors[i] = parent if match[parent] >= 0 else ancestors[parent]
+    return ancestors
+
+
+def longest_increasing(values: list) -> set:
+    """
+    Find a longest strictly increasing subsequence
+    :return: set of positions of its values
+    """
+    tails = []  # Smallest tail value of an increasing run of each length
+    tail_positions = []
+    previous = [-1] * len(values)
+    for k, v in enumerate(values):
+        length = bisect_left(tails, v)
+        if length == len(tails):
+            tails.append(v)
+            tail_positions.append(k)
+        else:
+            tails[length] = v
+            tail_positions[length] = k
+        previous[k] = tail_positions[length - 1] if length > 0 else -1
+
+    kept = set()
+    k = tail_positions[-1] if tail_positions else -1
+    while k >= 0:
+        kept.add(k)
+        k = previous[k]
+    return kept
@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+
+from plan_cache import normalize_sql
+from plan_walk import decode_json
+
+
+class PlanRecorder:
+    """
+    Records every planned EXPLAIN statement and its plan to a JSON Lines fixture file
+    """
+
+    def __init__(self, path: str):
+        """
+        Init plan recorder, appending to the fixture file
+        :param path: Path to the fixture file
+        """
+        self.path = path
+        self.__lock = threading.Lock()  # Plans are recorded from the planner's worker threads in pooled mode
+
+    def record(self, statement: str, plan, elapsed_ms: float) -> None:
+        """
+        Append a plan to the fixture file
+        :param statement: The EXPLAIN statement, with all of its planner settings
+        :param plan: The raw plan, decoded or as JSON text
+        :param elapsed_ms: Time the db took to return the plan, in ms
+        :return: None
+        """
+        if isinstance(plan, str):
+            # Already JSON, written as is instead of decoding it to encode it again. Newlines in JSON text can only be
+            # whitespace between tokens, those in strings are escaped, so they are dropped to keep the plan on a line
+            plan = plan.replace("\n", "")
+            line = json.dumps({"statement": statement, "elapsed_ms": elapsed_ms})[:-1] + f', "plan": {plan}}}'
+        else:
+            line = json.dumps({"statement": statement, "plan": plan, "elapsed_ms": elapsed_ms})
+        with self.__lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+    def record_planner_methods(self, planner_methods: dict) -> None:
+        """
+        Append the planner method switches of the server, they are part of every recorded statement and older
+        servers have fewer of them
+        :param planner_methods: dict of operation to planner method switch, see QueryPlanner.planner_methods
+        :return: None
+        """
+        with self.__lock, open(self.path, "a") as f:
+            f.write(json.dumps({"planner_methods": planner_methods}) + "\n")
+
+
+class PlanReplayer:
+    """
+    Serves plans recorded by PlanRecorder instead of a db
+    """
+
+    def __init__(self, path: str, latency=None):
+        """
+        Init plan replayer, loading the fixture file
+        :param path: Path to the fixture file
+        :param latency: Simulated db latency of each plan: None for no delay, "recorded" for the recorded time,
+                        a number of ms, or a function of (statement, plan) returning ms
+        """
+        self.latency = latency
+        self.planner_methods = None  # Switches of the server the plans were recorded on, if recorded
+        self.__plans = {}
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except RecursionError:
+                    item = decode_json(line)  # A plan nested deeper than json.loads can decode
+                if "planner_methods" in item:
+                    self.planner_methods = item["planner_methods"]
+                    continue
+                # Later recordings of the same statement win
+                self.__plans[normalize_sql(item["statement"])] = (item["plan"], item.get("elapsed_ms", 0))
+
+    def __len__(self):
+        return len(self.__plans)
+
+    def get_plan(self, statement: str):
+        """
+        Get the recorded plan of a statement, after the simulated latency
+        Throws Exception if the statement was not recorded
+        :param statement: The EXPLAIN statement, with all of its planner settings
+        :return: The raw plan
+        """
+        recorded = self.__plans.get(normalize_sql(statement))
+        if recorded is None:
+            raise Exception(f"No recorded plan for statement: {statement}")
+
+        plan, elapsed_ms = recorded
+        if self.latency == "recorded":
+            delay = elapsed_ms
+        elif callable(self.latency):
+            delay = self.latency(statement, plan)
+        else:
+            delay = self.latency or 0
+
+        if delay > 0:
+            time.sleep(delay / 1000)
+        return plan
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import threading
+
+from plan_cache import normalize_sql
+
+# Fingerprint of everything the planner reads from the db: the user relations, their columns,
+# constraints and statistics, plus the server version and the cost settings
+# Any DDL, ANALYZE, VACUUM or cost tuning changes it
+fingerprint_query = """
+SELECT md5(concat_ws('|',
+    current_setting('server_version_num'),
+    current_setting('seq_page_cost'),
+    current_setting('random_page_cost'),
+    current_setting('cpu_tuple_cost'),
+    current_setting('cpu_index_tuple_cost'),
+    current_setting('cpu_operator_cost'),
+    current_setting('effective_cache_size'),
+    current_setting('work_mem'),
+    (SELECT string_agg(concat_ws(':', c.oid, c.relfilenode, c.relkind, c.relpages, c.reltuples, c.relnatts,
+                                 pg_stat_get_last_analyze_time(c.oid), pg_stat_get_last_autoanalyze_time(c.oid)),
+                       ',' ORDER BY c.oid)
+     FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+     WHERE n.nspname NOT IN ('pg_catalog', 'information_schema') AND n.nspname NOT LIKE 'pg_toast%'),
+    (SELECT string_agg(concat_ws(':', a.attrelid, a.attnum, a.atttypid, a.attnotnull, a.attisdropped),
+                       ',' ORDER BY a.attrelid, a.attnum)
+     FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid JOIN pg_namespace n ON n.oid = c.relnamespace
+     WHERE a.attnum > 0 AND n.nspname NOT IN ('pg_catalog', 'information_schema') AND n.nspname NOT LIKE 'pg_toast%'),
+    (SELECT string_agg(oid::text, ',' ORDER BY oid) FROM pg_constraint),
+    (SELECT string_agg(oid::text, ',' ORDER BY oid) FROM pg_statistic_ext)
+))
+"""
+
+
+class PlanStore:
+    """
+    Persistent plan store backed by a single SQLite file
+    Plans are tagged with the fingerprint of the db they were planned on, and dropped once it changes
+    """
+
+    def __init__(self, path: str, db_name: str, fingerprint: str):
+        """
+        Open the plan store, dropping the plans of db_name that are out of date
+        :param path: Path to the SQLite file, created if missing
+        :param db_name: Identifies the db, plans of different dbs share the file
+        :param fingerprint: Current catalog fingerprint of the db, from fingerprint_query
+        """
+        self.db_name = db_name
+        self.fingerprint = fingerprint
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()  # One SQLite connection shared by the planner's worker threads
+
+        import sqlite3  # Only loaded when plans are persisted
+
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+
+        with self.__lock, self.__conn:
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS plans ("
+                "db TEXT NOT NULL, key TEXT NOT NULL, query TEXT NOT NULL, "
+                "fingerprint TEXT NOT NULL, plan TEXT NOT NULL, PRIMARY KEY (db, key))"
+            )
+            self.__conn.execute("DELETE FROM plans WHERE db = ? AND fingerprint != ?", (db_name, fingerprint))
+
+    @staticmethod
+    def __hash_key(key: tuple) -> str:
+        return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+    def get(self, key: tuple):
+        """
+        Look up a plan
+        :param key: Key from make_plan_key
+        :return: The raw plan as JSON text, None on a miss
+        """
+        with self.__lock:
+            row = self.__conn.execute(
+                "SELECT plan FROM plans WHERE db = ? AND key = ? AND fingerprint = ?",
+                (self.db_name, self.__hash_key(key), self.fingerprint)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: tuple, plan) -> None:
+        """
+        Store a plan
+        :param key: Key from make_plan_key
+        :param plan: The raw plan, decoded or as JSON text
+        :return: None
+        """
+        if not isinstance(plan, str):
+            plan = json.dumps(plan)
+        with self.__lock, self.__conn:
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO plans (db, key, query, fingerprint, plan) VALUES (?, ?, ?, ?, ?)",
+                (self.db_name, self.__hash_key(key), key[0], self.fingerprint, plan)
+            )
+
+    def invalidate(self, sql_query: str = None) -> None:
+        """
+        Drop stored plans of the db
+        :param sql_query: Only drop the plans of this query, drops everything if not given
+        :return: None
+        """
+        with self.__lock, self.__conn:
+            if sql_query is None:
+                self.__conn.execute("DELETE FROM plans WHERE db = ?", (self.db_name,))
+            else:
+                self.__conn.execute(
+                    "DELETE FROM plans WHERE db = ? AND query = ?", (self.db_name, normalize_sql(sql_query))
+                )
+
+    def stats(self) -> dict:
+        """
+        Get the store statistics
+        :return: dict of hits and misses
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        self.__conn.close()
@@ -0,0 +1,148 @@
+# Iterative tree traversals, safe for plans of any depth. Every traversal takes a function returning the children
+# of a node, so that plan nodes, raw plans from PostgreSQL and indexed trees are walked alike
+import re
+from json import JSONDecodeError
+from json.decoder import JSONDecoder, scanstring
+
+json_whitespace = re.compile(r"[ \t\n\r]*")
+scan_scalar = JSONDecoder().scan_once  # Only given numbers and literals, it recurses into arrays and objects
+
+
+def node_children(node) -> list:
+    return node.children
+
+
+def raw_plan_children(plan: dict) -> list:
+    return plan.get("Plans", [])
+
+
+def preorder(root, children=node_children):
+    """
+    Walk a tree parents first, children from left to right
+    :param root: The root node
+    :param children: Function returning the children of a node
+    :return: generator of (node, parent, depth), the parent of the root is None
+    """
+    stack = [(root, None, 0)]
+    while stack:
+        node, parent, depth = stack.pop()
+        yield node, parent, depth
+        kids = children(node)
+        if kids:
+            stack.extend((child, node, depth + 1) for child in reversed(kids))
+
+
+def postorder(root, children=node_children):
+    """
+    Walk a tree children first, from left to right
+    :param root: The root node
+    :param children: Function returning the children of a node
+    :return: generator of nodes
+    """
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        kids = children(node)
+        if expanded or not kids:
+            yield node
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(kids))
+
+
+def paired_walk(a, b, children=node_children, children_b=None):
+    """
+    Walk two trees together in pre-order, pairing children by position
+    A node without a counterpart is paired with None, and so are its descendants
+    :param a: Root of the first tree
+    :param b: Root of the second tree
+    :param children: Function returning the children of a node
+    :param children_b: Function returning the children of a node of the second tree, same as children if not given
+    :return: generator of (node of the first tree, node of the second tree)
+    """
+    children_b = children_b or children
+    stack = [(a, b)]
+    while stack:
+        x, y = stack.pop()
+        yield x, y
+        kids_x = children(x) if x is not None else []
+        kids_y = children_b(y) if y is not None else []
+        n = max(len(kids_x), len(kids_y))
+        for i in range(n - 1, -1, -1):
+            stack.append((kids_x[i] if i < len(kids_x) else None, kids_y[i] if i < len(kids_y) else None))
+
+
+def decode_json(text: str, object_hook=None):
+    """
+    Decode JSON with an explicit stack instead of recursion, for documents nested deeper than json.loads can decode.
+    Slower than json.loads, so only meant as its fallback
+    Throws JSONDecodeError if the text is not valid JSON
+    :param text: The JSON text
+    :param object_hook: Called with every decoded object, its result is used instead, as in json.loads
+    :return: The decoded value
+    """
+    def skip(i: int) -> int:
+        return json_whitespace.match(text, i).end()
+
+    def key_at(i: int) -> tuple:
+        if text[i:i + 1] != '"':
+            raise JSONDecodeError("Expecting property name enclosed in double quotes", text, i)
+        key, i = scanstring(text, i + 1)
+        i = skip(i)
+        if text[i:i + 1] != ":":
+            raise JSONDecodeError("Expecting ':' delimiter", text, i)
+        return key, skip(i + 1)
+
+    def close(container):
+        return object_hook(container) if object_hook and isinstance(container, dict) else container
+
+    stack = []  # [container, key of the value being decoded, None in arrays] of the open containers, innermost last
+    i = skip(0)
+    while True:
+        # Decode a value, or open the container it starts
+        char = text[i:i + 1]
+        if char == "{" or char == "[":
+            container = {} if char == "{" else []
+            i = skip(i + 1)
+            if text[i:i + 1] == ("}" if char == "{" else "]"):
+                value = close(container)
+                i += 1
+            else:
+                key = None
+                if char == "{":
+                    key, i = key_at(i)
+                stack.append([container, key])
+                continue
+        elif char == '"':
+            value, i = scanstring(text, i + 1)
+        else:
+            try:
+                value, i = scan_scalar(text, i)
+            except StopIteration as ex:
+                raise JSONDecodeError("Expecting value", text, ex.value) from None
+
+        # Add the value to its container, closing every container it completes
+        while stack:
+            entry = stack[-1]
+            container, key = entry
+            if key is None:
+                container.append(value)
+            else:
+                container[key] = value
+
+            i = skip(i)
+            if text[i:i + 1] == ",":
+                i = skip(i + 1)
+                if key is not None:
+                    entry[1], i = key_at(i)
+                break
+            if text[i:i + 1] != ("]" if key is None else "}"):
+                raise JSONDecodeError("Expecting ',' delimiter", text, i)
+            i += 1
+            stack.pop()
+            value = close(container)
+        else:
+            i = skip(i)
+            if i != len(text):
+                raise JSONDecodeError("Extra data", text, i)
+            return value
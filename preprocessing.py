@@ -1,27 +1,207 @@
-import psycopg2
+import itertools
+import json
+import re
+import threading
+import time
+from collections import deque
 
-from annotation import extra_annotation
-from node import PlanNode
+from annotation import enabled_annotation, extra_annotation
+from metrics import MetricsCollector, timed
+from node import PlanNode, disable_cost
+from plan_diff import diff_trees
+from plan_cache import PlanCache, make_plan_key
+from plan_walk import decode_json, preorder, raw_plan_children
+
+query_canceled = "57014"  # SQLSTATE of statements cancelled or past their statement_timeout
+
+
+class PlanningCancelled(Exception):
+    """
+    Raised by generate_plans when it's cancelled through QueryPlanner.cancel
+    """
+
+
+class PlanTimedOut(Exception):
+    """
+    Raised when a plan runs out of its time budget, generate_plans only raises it for the QEP
+    """
 
 
 class QueryPlanner:
     """
     Query planner class
     """
+    join_types = ["Hash Join", "Nested Loop", "Merge Join"]
+    scan_types = ["Seq Scan", "Bitmap Heap Scan", "Index Scan", "Index Only Scan", "Tid Scan"]
+
+    # Planner Method Configuration switch of each operation, those the server does not know are left out
+    planner_methods = {
+        "Hash Join": "enable_hashjoin",
+        "Index Scan": "enable_indexscan",
+        "Merge Join": "enable_mergejoin",
+        "Nested Loop": "enable_nestloop",
+        "Seq Scan": "enable_seqscan",
+        "Bitmap Heap Scan": "enable_bitmapscan",
+        "Index Only Scan": "enable_indexonlyscan",
+        "Tid Scan": "enable_tidscan",
+        "HashAggregate": "enable_hashagg",
+        "Sort": "enable_sort",
+        "Incremental Sort": "enable_incremental_sort",
+        "Materialize": "enable_material",
+        "Memoize": "enable_memoize",
+        "Parallel Append": "enable_parallel_append",
+        "Parallel Hash": "enable_parallel_hash",
+        "Gather Merge": "enable_gathermerge",
+        "Partitionwise Join": "enable_partitionwise_join",
+        "Partitionwise Aggregate": "enable_partitionwise_aggregate",
+        "Partition Pruning": "enable_partition_pruning",
+    }
+
+    # Operations off by default, their AQP turns them on instead
+    off_by_default = ["Partitionwise Join", "Partitionwise Aggregate"]
+
+    # Node types a plan has when an AQP of the operation may differ from it, if not just the operation's own
+    operation_node_types = {
+        "Tid Scan": ["Tid Scan", "Tid Range Scan"],
+        "Partitionwise Join": ["Append", "Merge Append", "Parallel Append"],
+        "Partitionwise Aggregate": ["Append", "Merge Append", "Parallel Append"],
+        "Partition Pruning": ["Append", "Merge Append", "Parallel Append"],
+    }
+
+    # What the planner uses instead of the operations other than joins and scans, for the extra annotations
+    alternative_ops = {
+        "HashAggregate": ["Sort", "GroupAggregate"],
+        "Sort": ["Incremental Sort", "Index Scan"],
+        "Incremental Sort": ["Sort"],
+        "Materialize": ["repeated scans of its input"],
+        "Memoize": ["Materialize", "repeated scans of its input"],
+        "Parallel Append": ["Append"],
+        "Parallel Hash": ["a Hash per worker"],
+        "Gather Merge": ["Gather", "Sort"],
+        "Partitionwise Join": ["a join of the whole tables"],
+        "Partitionwise Aggregate": ["an aggregate of the whole tables"],
+        "Partition Pruning": ["scans of every partition"],
+    }
+
+    # Operations planned in pooled mode at the same time as the QEP, before knowing if it uses them: the joins and
+    # scans nearly every plan has. The AQPs of the other operations are only planned once the QEP uses them
+    speculative_ops = ["Hash Join", "Nested Loop", "Merge Join", "Seq Scan", "Bitmap Heap Scan", "Index Scan"]
 
-    def __init__(self, db_host, db_port, db_name, db_user, db_password):
+    # Planner settings applied to every plan, on top of the planner method configuration
+    planner_settings = {"max_parallel_workers_per_gather": 0}
+
+    # Seconds past the request budget before the running statements are cancelled from the client,
+    # the server stops them on its own through statement_timeout in the meantime
+    watchdog_grace = 1.0
+
+    def __init__(self, db_host=None, db_port=None, db_name=None, db_user=None, db_password=None, pool_size: int = 1,
+                 cache_size: int = 128, store_path: str = None, batched: bool = True, analyze: bool = False,
+                 analyze_aqps: bool = False, analyze_timeout: int = 30000, record_path: str = None,
+                 replay_path: str = None, replay_latency=None, collector: MetricsCollector = None,
+                 plan_timeout: int = None, request_timeout: float = None, parallel_workers: int = 0,
+                 cost_model=None):
         """
         Init Query Planner
         Throws psycopg2.OperationalError if the connection to the db fails
+        :param pool_size: Number of backend connections used to plan the QEP and AQPs at the same time,
+                          1 plans them one after another over a single connection
+        :param cache_size: Max number of plans kept in the plan cache, 0 disables caching
+        :param store_path: Path to a SQLite file persisting plans across runs, not used if not given
+        :param batched: Plan inside one transaction with transaction-local settings, emitting only the settings
+                        that changed since the previous plan, and roll it back at the end. Otherwise each plan
+                        sets every setting on the session and is committed on its own
+        :param analyze: Run the QEP with EXPLAIN ANALYZE to get actual timings, rows and buffers.
+                        The query is executed inside a transaction that is always rolled back
+        :param analyze_aqps: Also run the AQPs with EXPLAIN ANALYZE, when analyze is on
+        :param analyze_timeout: Statement timeout of an EXPLAIN ANALYZE run, in ms
+        :param record_path: Path to a fixture file recording every EXPLAIN statement and its plan
+        :param replay_path: Path to a fixture file to serve plans from instead of the db, no connection is made.
+                            The store is not used when replaying
+        :param replay_latency: Simulated db latency when replaying, see PlanReplayer
+        :param collector: Collector of per-stage timings and counters, see metrics.MetricsCollector.
+                          Nothing is measured if not given
+        :param plan_timeout: Statement timeout of each EXPLAIN, in ms, not limited if not given
+        :param request_timeout: Time budget of a whole generate_plans call, in seconds, not limited if not given.
+                                AQPs left when it runs out are reported as timed out
+        :param parallel_workers: Max parallel workers per Gather node, 0 plans without parallelism, so that
+                                 Parallel Append, Parallel Hash and Gather Merge AQPs are only generated if set
+        :param cost_model: Model predicting the execution time of the plans, see calibration.CostModel.
+                           Times are not predicted if not given
         """
-        self.conn = psycopg2.connect(
-            user=db_user,
-            password=db_password,
-            host=db_host,
-            port=db_port,
-            database=db_name
-        )
-        self.cursor = self.conn.cursor()
+        # Instrumentation hooks
+        self.collector = collector
+
+        # Recorded plans, served instead of the db
+        self.replayer = None
+        self.recorder = None
+        if replay_path or record_path:
+            from plan_replay import PlanRecorder, PlanReplayer  # Only needed to replay or record plans
+
+            self.replayer = PlanReplayer(replay_path, replay_latency) if replay_path else None
+            self.recorder = PlanRecorder(record_path) if record_path else None
+
+        # Pooled mode, every plan gets its own backend connection
+        self.pool_size = pool_size
+        self.pool = None
+        self.conn = None
+        self.cursor = None
+        if self.replayer is None:
+            # The db driver is imported on the first connection, so that replaying and library use don't load it
+            import psycopg2
+            from psycopg2.pool import ThreadedConnectionPool
+
+            conn_params = dict(
+                user=db_user,
+                password=db_password,
+                host=db_host,
+                port=db_port,
+                database=db_name
+            )
+            with timed(collector, "connect"):
+                self.conn = psycopg2.connect(**conn_params)
+                self.cursor = self.conn.cursor()
+                self.__keep_raw_json(self.conn)
+                if pool_size > 1:
+                    self.pool = ThreadedConnectionPool(pool_size, pool_size, **conn_params)
+            self.planner_methods = self.__get_planner_methods()
+            if self.recorder is not None:
+                self.recorder.record_planner_methods(self.planner_methods)
+        elif self.replayer.planner_methods is not None:
+            # Plan with the switches of the server the fixture was recorded on, so that the statements match
+            self.planner_methods = self.replayer.planner_methods
+
+        self.planner_settings = dict(self.planner_settings, max_parallel_workers_per_gather=parallel_workers)
+
+        # Settings applied in the open planning transaction of each connection, in batched mode
+        self.batched = batched
+        self.__txn_settings = {}
+
+        # Run plans with EXPLAIN ANALYZE
+        self.analyze = analyze
+        self.analyze_aqps = analyze_aqps
+        self.analyze_timeout = analyze_timeout
+
+        # Raw plans of recently planned queries
+        self.plan_cache = PlanCache(cache_size)
+
+        # Cancellation of the in-flight generate_plans call
+        self.__cancelled = threading.Event()
+        self.__active_conns = set()  # Connections with an EXPLAIN query running
+
+        # Time budgets, enforced by the server with statement_timeout, and by cancelling the running
+        # statements once the budget of the request is spent
+        self.plan_timeout = plan_timeout
+        self.request_timeout = request_timeout
+        self.__deadline = None
+
+        # Plans persisted across runs, invalidated when the db catalog or statistics change
+        self.plan_store = None
+        if store_path and self.replayer is None:
+            from plan_store import PlanStore  # Only needed with a plan store, it loads hashlib
+
+            with timed(collector, "fingerprint"):
+                fingerprint = self.__get_catalog_fingerprint()
+            self.plan_store = PlanStore(store_path, f"{db_host}:{db_port}/{db_name}", fingerprint)
 
         self.qep: PlanNode = None  # The root node to the qep tree
 
@@ -35,11 +215,25 @@ class QueryPlanner:
         # Compare performance between QEP and AQPs
         self.extra_annotation = {}
 
-    def generate_plans(self, sql_query: str) -> None:
+        # Operations whose AQP timed out
+        self.timed_out = []
+
+        # Operations the planner cannot avoid (or make use of), their AQP is the QEP again
+        self.unavoidable = []
+
+        # Predicted execution time of the plans in ms, by "QEP" or the operation turned off
+        self.cost_model = cost_model
+        self.predicted_time = {}
+
+    def generate_plans(self, sql_query: str, on_plan=None) -> None:
         """
         Generate 1 QEP and multiple AQPs
-        Throws Exception if the sql query is invalid
+        Throws Exception if the sql query is invalid, PlanningCancelled if cancelled,
+        PlanTimedOut if the QEP timed out
         :param sql_query: The SQL query
+        :param on_plan: Called with (operation turned off, root node) as soon as each plan is ready,
+                        the operation is None for the QEP, which always comes first.
+                        The root node is None for an AQP that timed out
         :return: None
         """
         # Reset variables
@@ -47,20 +241,630 @@ class QueryPlanner:
         self.aqp = {}
         self.alt_plan_names = []
         self.extra_annotation = {}
+        self.predicted_time = {}
+        self.timed_out = []
+        self.unavoidable = []
+        self.__cancelled.clear()
+
+        # Client-side watchdog, in case the server does not stop the running statements in time
+        watchdog = None
+        if self.request_timeout is not None:
+            self.__deadline = time.perf_counter() + self.request_timeout
+            watchdog = threading.Timer(self.request_timeout + self.watchdog_grace, self.__cancel_statements)
+            watchdog.daemon = True
+            watchdog.start()
 
         # Generate plans
-        self.__generate_qep(sql_query)
-        self.__generate_aqps(sql_query)
+        try:
+            if self.pool_size > 1:
+                self.__generate_plans_pooled(sql_query, on_plan)
+            else:
+                self.__generate_qep(sql_query)
+                if on_plan:
+                    on_plan(None, self.qep)
+                self.__generate_aqps(sql_query, on_plan)
+        finally:
+            if watchdog:
+                watchdog.cancel()
+            self.__deadline = None
+            self.__end_planning_transactions()
+
+    def search_alternative_plans(self, sql_query: str, top_k: int = 5, max_explains: int = 32,
+                                 time_budget: float = None, prune_factor: float = 10.0) -> list:
+        """
+        Search AQPs over combinations of turned off operations, e.g. no Hash Join together with no Seq Scan
+        Combinations are explored breadth first, only adding operations the plan still uses.
+        Turning off more operations never makes a plan cheaper, so a plan costing more than prune_factor times
+        the cheapest plan seen is not explored further
+        Throws Exception if the sql query is invalid, PlanningCancelled if cancelled
+        :param sql_query: The SQL query
+        :param top_k: Max number of plans returned
+        :param max_explains: Max number of plans generated
+        :param time_budget: Max seconds spent searching, not limited if not given
+        :param prune_factor: Plans costing more than this many times the cheapest plan are pruned
+        :return: list of (operations turned off, root node) of distinct plans, cheapest first,
+                 nodes differing from the QEP are marked
+        """
+        self.__cancelled.clear()
+        deadline = time.perf_counter() + time_budget if time_budget is not None else None
+        # Turning on an operation can make a plan cheaper, so only operations on by default are combined
+        ops = [t for t in self.__get_aqp_operations() if t not in self.off_by_default]
+
+        try:
+            qep = self.build_tree_from_raw_plan(self.__get_plan(sql_query, []))
+            best_cost = qep.cost
+            seen_off_lists = {()}
+            seen_signatures = {PlanNode.get_signature(qep)}
+            explains = 1
+            results = []
+
+            queue = deque([((), qep)])
+            while queue:
+                off_list, root = queue.popleft()
+                unique_types = PlanNode.get_unique_node_types(root)
+                for t in ops:
+                    if t in off_list or not self.__uses_operation(t, unique_types):
+                        continue
+
+                    new_off_list = tuple(x for x in ops if x in off_list or x == t)
+                    if new_off_list in seen_off_lists:
+                        continue
+                    seen_off_lists.add(new_off_list)
+
+                    if explains >= max_explains or (deadline is not None and time.perf_counter() > deadline):
+                        queue.clear()
+                        break
+
+                    explains += 1
+                    try:
+                        alt = self.build_tree_from_raw_plan(self.__get_plan(sql_query, list(new_off_list)))
+                    except PlanTimedOut:
+                        continue
+
+                    # A turned off operation the planner could not avoid, or too expensive to explore
+                    if set(new_off_list) & set(PlanNode.get_unique_node_types(alt)):
+                        continue
+                    if alt.cost > prune_factor * best_cost:
+                        continue
+
+                    best_cost = min(best_cost, alt.cost)
+                    queue.append((new_off_list, alt))
+
+                    signature = PlanNode.get_signature(alt)
+                    if signature not in seen_signatures:
+                        seen_signatures.add(signature)
+                        results.append((list(new_off_list), alt))
+        finally:
+            self.__end_planning_transactions()
+
+        results.sort(key=lambda x: x[1].cost)
+        results = results[:top_k]
+        for _, alt in results:
+            PlanNode.compare_trees(qep, alt)  # mark diff
+        return results
+
+    def sweep_cost_parameters(self, sql_query: str, grid: dict, off_list: list = None, refine_steps: int = 0) -> dict:
+        """
+        Re-plan the query over every combination of planner cost parameters, e.g.
+        {"random_page_cost": [1.1, 2, 4], "work_mem": [1024, 65536], "effective_cache_size": ["128MB", "4GB"]}
+        and find where the chosen plan changes. Plans of the same shape are kept once.
+        Between neighbouring grid points of a parameter the plan flips at a crossover, crossovers between numbers
+        are narrowed down by bisection. Plans are generated in parallel when pool_size > 1
+        Throws Exception if the sql query or a parameter is invalid, PlanningCancelled if cancelled
+        :param sql_query: The SQL query
+        :param grid: dict of parameter name to the values to plan with, in increasing order.
+                     Numbers are in the parameter's base unit, strings may carry a unit, e.g. "64MB"
+        :param off_list: List of operations turned off in every plan
+        :param refine_steps: Number of bisection steps per crossover
+        :return: dict of
+                 "plans": root nodes of the distinct plans, in order of first appearance,
+                          nodes differing from the first plan are marked
+                 "points": list of (settings, plan index, cost) of every grid point, the plan index and cost are
+                           None if the plan timed out
+                 "curves": dict of plan index to the list of (settings, cost) where the plan was chosen,
+                           including the bisection points
+                 "crossovers": list of dict of parameter, settings (of the other parameters), below and above
+                               (the closest values found on both sides), from_plan, to_plan and distance
+                               (edit distance between the two plans)
+        """
+        for name in grid:
+            if not re.fullmatch(r"[a-z_]+", name):
+                raise Exception(f"Invalid planner parameter: {name}")
+
+        self.__cancelled.clear()
+        off_list = off_list or []
+        names = list(grid)
+        positions = list(itertools.product(*(range(len(values)) for values in grid.values())))
+        grid_settings = [{name: grid[name][i] for name, i in zip(names, position)} for position in positions]
+        plans = []
+        signatures = {}
+        curves = {}
+
+        def classify(settings_list: list) -> list:
+            # Plan index and cost of every setting, recording new plan shapes and the cost curves
+            results = []
+            raw_plans = self.__get_plans_with_settings(sql_query, off_list, settings_list)
+            for settings, raw in zip(settings_list, raw_plans):
+                if raw is None:
+                    results.append((None, None))
+                    continue
+                root = self.build_tree_from_raw_plan(raw)
+                index = signatures.setdefault(PlanNode.get_signature(root), len(plans))
+                if index == len(plans):
+                    plans.append(root)
+                curves.setdefault(index, []).append((settings, root.cost))
+                results.append((index, root.cost))
+            return results
+
+        try:
+            results = classify(grid_settings)
+            at = dict(zip(positions, results))
+
+            crossovers = []
+            for k, name in enumerate(names):
+                for position, (index, _) in at.items():
+                    if position[k] + 1 >= len(grid[name]):
+                        continue
+                    above = position[:k] + (position[k] + 1,) + position[k + 1:]
+                    above_index = at[above][0]
+                    if index is None or above_index is None or index == above_index:
+                        continue
+                    crossovers.append({
+                        "parameter": name,
+                        "settings": {n: grid[n][i] for n, i in zip(names, position) if n != name},
+                        "below": grid[name][position[k]],
+                        "above": grid[name][position[k] + 1],
+                        "from_plan": index,
+                        "to_plan": above_index,
+                    })
+
+            # Bisect the numeric crossovers, all of them at once at every step
+            is_number = lambda x: isinstance(x, (int, float)) and not isinstance(x, bool)
+            pending = [c for c in crossovers if is_number(c["below"]) and is_number(c["above"])]
+            for _ in range(refine_steps):
+                for c in pending:
+                    mid = (c["below"] + c["above"]) / 2
+                    c["mid"] = type(c["below"])(mid) if isinstance(c["below"], int) and isinstance(c["above"], int) \
+                        else mid
+                pending = [c for c in pending if c["mid"] not in (c["below"], c["above"])]
+                if not pending:
+                    break
+
+                mids = classify([dict(c["settings"], **{c["parameter"]: c["mid"]}) for c in pending])
+                still_pending = []
+                for c, (index, _) in zip(pending, mids):
+                    if index is None:
+                        continue
+                    if index == c["from_plan"]:
+                        c["below"] = c["mid"]
+                    else:
+                        # Narrow down to the first change, even if it's to a third plan
+                        c["above"] = c["mid"]
+                        c["to_plan"] = index
+                    still_pending.append(c)
+                pending = still_pending
+        finally:
+            self.__end_planning_transactions()
+
+        for c in crossovers:
+            c.pop("mid", None)
+            c["distance"] = diff_trees(plans[c["from_plan"]], plans[c["to_plan"]]).distance
+        for root in plans[1:]:
+            PlanNode.compare_trees(plans[0], root)  # mark diff
+
+        return {
+            "plans": plans,
+            "points": [(settings, index, cost) for settings, (index, cost) in zip(grid_settings, results)],
+            "curves": curves,
+            "crossovers": crossovers,
+        }
+
+    def cancel(self) -> None:
+        """
+        Cancel the in-flight generate_plans call, can be called from any thread
+        The running EXPLAIN queries are cancelled on the backend and generate_plans raises PlanningCancelled
+        :return: None
+        """
+        self.__cancelled.set()
+        self.__cancel_statements()
+
+    def __cancel_statements(self) -> None:
+        """
+        Cancel the running EXPLAIN queries on the backend
+        :return: None
+        """
+        for conn in list(self.__active_conns):
+            conn.cancel()
+
+    def invalidate_cache(self, sql_query: str = None) -> None:
+        """
+        Drop cached plans, e.g. after the schema or statistics of the db changed
+        :param sql_query: Only drop the plans of this query, drops everything if not given
+        :return: None
+        """
+        self.plan_cache.invalidate(sql_query)
+        if self.plan_store is not None:
+            self.plan_store.invalidate(sql_query)
+
+    def close(self) -> None:
+        """
+        Close all connections to the db
+        :return: None
+        """
+        if self.pool:
+            self.pool.closeall()
+        if self.plan_store is not None:
+            self.plan_store.close()
+        if self.conn:
+            self.conn.close()
+
+    def __get_sql_query_plan(self, sql_query: str, off_list: list, conn=None, analyze: bool = False,
+                             extra_settings: dict = None):
+        """
+        Plan the query with the given operations turned off and return its plan
+        :param sql_query: The SQL query
+        :param off_list: List of operations to turn off
+        :param conn: Connection to run the query on, defaults to the planner's own connection
+        :param analyze: Run the query with EXPLAIN ANALYZE, its effects are always rolled back
+        :param extra_settings: Other planner settings of the plan, e.g. cost parameters, values formatted for SQL
+        :return: The raw plan, as the EXPLAIN JSON text
+        """
+        if conn is None:
+            conn, cursor = self.conn, self.cursor
+        else:
+            cursor = conn.cursor()
+
+        if self.__cancelled.is_set():
+            raise PlanningCancelled()
+        timeout = self.__get_statement_timeout(analyze)
+
+        if self.batched:
+            # Only send the settings that differ from what the open transaction already has
+            applied = self.__txn_settings.setdefault(conn, {})
+            settings = self.__prepare_settings(off_list)
+            settings.update(extra_settings or {})
+            if timeout is not None:
+                settings["statement_timeout"] = timeout
+            for key in applied:
+                settings.setdefault(key, "DEFAULT")  # Set by an earlier plan only
+            changed = {key: value for key, value in settings.items() if applied.get(key) != value}
+            q = "".join(f"SET LOCAL {key} = {value}; " for key, value in changed.items())
+            if analyze:
+                # Undo the effects of the query without ending the planning transaction
+                q += "SAVEPOINT analyze_plan; "
+            q += self.__prepare_explain_query(sql_query, analyze)
+            self.__count("set_statements", len(changed))
+        else:
+            q = self.__prepare_plan_query(self.__prepare_explain_query(sql_query, analyze, timeout), off_list,
+                                          extra_settings)
+            self.__count("set_statements",
+                         len(self.planner_methods) + len(self.planner_settings) + len(extra_settings or {}))
+
+        self.__active_conns.add(conn)
+        try:
+            with timed(self.collector, "execute"):
+                cursor.execute(q)
+            with timed(self.collector, "fetch"):
+                text = cursor.fetchone()[0]
+            self.__active_conns.discard(conn)  # Only the EXPLAIN query is cancelled
+            self.__count("round_trips")
+            if self.batched:
+                applied.update(changed)
+                if analyze:
+                    cursor.execute("ROLLBACK TO SAVEPOINT analyze_plan; RELEASE SAVEPOINT analyze_plan")
+                    self.__count("round_trips")
+            elif analyze:
+                conn.rollback()
+                self.__count("round_trips")
+            else:
+                conn.commit()
+                self.__count("round_trips")
+
+            if self.collector:
+                self.__count("plan_bytes", len(text.encode()))  # Size of the plan as sent by the server, in UTF-8
+            return text
+        except Exception as ex:
+            self.__active_conns.discard(conn)
+            conn.rollback()
+            self.__txn_settings.pop(conn, None)
+            if self.__cancelled.is_set():
+                raise PlanningCancelled()
+            if getattr(ex, "pgcode", None) == query_canceled:
+                raise PlanTimedOut(f"Plan timed out after {timeout} ms" if timeout is not None else "Plan timed out")
+            raise Exception(ex)
+        finally:
+            self.__active_conns.discard(conn)
+
+    def __end_planning_transactions(self) -> None:
+        """
+        Roll back the open planning transactions, so that no setting outlives them
+        :return: None
+        """
+        for conn in list(self.__txn_settings):
+            conn.rollback()
+            self.__count("round_trips")
+        self.__txn_settings.clear()
+
+    def __count(self, counter: str, value: int = 1) -> None:
+        """
+        Increase a counter of the collector, if any
+        :param counter: Name of the counter
+        :param value: Amount to increase it by
+        :return: None
+        """
+        if self.collector:
+            self.collector.on_count(counter, value)
+
+    @staticmethod
+    def __keep_raw_json(conn) -> None:
+        """
+        Make the connection return json columns as text, so that plans are decoded straight into plan nodes
+        :param conn: The connection
+        :return: None
+        """
+        import psycopg2.extras
+
+        psycopg2.extras.register_default_json(conn, loads=lambda x: x)
+
+    def __get_catalog_fingerprint(self) -> str:
+        """
+        Get the fingerprint of the db catalog and statistics, it changes whenever cached plans may be out of date
+        :return: The fingerprint
+        """
+        from plan_store import fingerprint_query
+
+        try:
+            self.cursor.execute(fingerprint_query)
+            fingerprint = self.cursor.fetchone()[0]
+            self.conn.commit()
+            return fingerprint
+        except Exception as ex:
+            self.conn.rollback()
+            raise Exception(ex)
 
-    def __get_sql_query_plan(self, sql_query: str):
+    def __get_planner_methods(self) -> dict:
+        """
+        Get the planner method switches known to the server, the newer ones are missing on older servers
+        :return: dict of operation to planner method switch
+        """
         try:
-            self.cursor.execute(sql_query)
+            self.cursor.execute("SELECT name FROM pg_settings WHERE name = ANY(%s)",
+                                (list(self.planner_methods.values()),))
+            names = {row[0] for row in self.cursor.fetchall()}
             self.conn.commit()
-            plan = self.cursor.fetchall()
-            return plan[0][0][0]["Plan"]
         except Exception as ex:
             self.conn.rollback()
             raise Exception(ex)
+        return {key: value for key, value in self.planner_methods.items() if value in names}
+
+    def __get_pooled_query_plan(self, sql_query: str, off_list: list, analyze: bool = False,
+                                extra_settings: dict = None):
+        """
+        Plan the query on a connection borrowed from the pool
+        :param sql_query: The SQL query
+        :param off_list: List of operations to turn off
+        :param analyze: Run the query with EXPLAIN ANALYZE
+        :param extra_settings: Other planner settings of the plan, values formatted for SQL
+        :return: The raw plan
+        """
+        conn = self.pool.getconn()
+        self.__keep_raw_json(conn)
+        try:
+            return self.__get_sql_query_plan(sql_query, off_list, conn, analyze, extra_settings)
+        finally:
+            # The pool rolls back the planning transaction of returned connections
+            if self.__txn_settings.pop(conn, None) is not None:
+                self.__count("round_trips")
+            self.pool.putconn(conn)
+
+    def __get_plan(self, sql_query: str, off_list: list, pooled: bool = False, analyze: bool = False,
+                   extra_settings: dict = None):
+        """
+        Get the raw plan of a query with the given operations turned off, from the plan cache or store if possible
+        :param sql_query: The SQL query
+        :param off_list: List of operations to turn off
+        :param pooled: Run the EXPLAIN query on a pooled connection
+        :param analyze: Run the query with EXPLAIN ANALYZE, actual statistics are always measured afresh
+        :param extra_settings: Other planner settings of the plan, values formatted for SQL
+        :return: The raw plan
+        """
+        if analyze:
+            return self.__explain(sql_query, off_list, pooled, analyze, extra_settings)
+
+        with timed(self.collector, "cache"):
+            key = make_plan_key(sql_query, off_list, dict(self.planner_settings, **(extra_settings or {})))
+            plan = self.plan_cache.get(key)
+            if plan is None and self.plan_store is not None:
+                plan = self.plan_store.get(key)
+                if plan is not None:
+                    self.plan_cache.put(key, plan)
+        if plan is not None:
+            return plan
+
+        plan = self.__explain(sql_query, off_list, pooled, extra_settings=extra_settings)
+        if self.plan_store is not None:
+            self.plan_store.put(key, plan)
+        self.plan_cache.put(key, plan)
+        return plan
+
+    def __explain(self, sql_query: str, off_list: list, pooled: bool = False, analyze: bool = False,
+                  extra_settings: dict = None):
+        """
+        Get the raw plan of a query from the db, or from the recorded plans when replaying
+        :param sql_query: The SQL query
+        :param off_list: List of operations to turn off
+        :param pooled: Run the EXPLAIN query on a pooled connection
+        :param analyze: Run the query with EXPLAIN ANALYZE
+        :param extra_settings: Other planner settings of the plan, values formatted for SQL
+        :return: The raw plan
+        """
+        if self.__cancelled.is_set():
+            raise PlanningCancelled()
+        if self.__deadline is not None and time.perf_counter() >= self.__deadline:
+            raise PlanTimedOut("Time budget of the request spent")
+
+        # Recordings are keyed by the statement with every setting, whatever was actually sent in batched mode
+        statement = None
+        if self.replayer is not None or self.recorder is not None:
+            statement = self.__prepare_plan_query(
+                self.__prepare_explain_query(sql_query, analyze, self.analyze_timeout if analyze else None), off_list,
+                extra_settings)
+        if self.replayer is not None:
+            with timed(self.collector, "execute"):
+                return self.replayer.get_plan(statement)
+
+        start = time.perf_counter()
+        if pooled:
+            plan = self.__get_pooled_query_plan(sql_query, off_list, analyze, extra_settings)
+        else:
+            plan = self.__get_sql_query_plan(sql_query, off_list, analyze=analyze, extra_settings=extra_settings)
+
+        if self.recorder is not None:
+            self.recorder.record(statement, plan, (time.perf_counter() - start) * 1000)
+        return plan
+
+    def __get_plans_with_settings(self, sql_query: str, off_list: list, settings_list: list) -> list:
+        """
+        Get the raw plans of a query under several planner settings, in parallel on the pool if there is one
+        :param sql_query: The SQL query
+        :param off_list: List of operations to turn off
+        :param settings_list: list of dict of planner settings
+        :return: list of raw plans, None for the plans that timed out
+        """
+        def get_plan(settings: dict):
+            extra_settings = {key: self.format_setting(value) for key, value in settings.items()}
+            try:
+                return self.__get_plan(sql_query, off_list, self.pool_size > 1, extra_settings=extra_settings)
+            except PlanTimedOut:
+                return None
+
+        if self.pool_size > 1:
+            from concurrent.futures import ThreadPoolExecutor  # Only needed in pooled mode
+
+            with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+                return list(executor.map(get_plan, settings_list))
+        return [get_plan(settings) for settings in settings_list]
+
+    @staticmethod
+    def format_setting(value) -> str:
+        """
+        Format the value of a planner setting for a SET statement
+        :param value: A number, or a string such as "64MB"
+        :return: The number, or the quoted string
+        """
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        return "'" + str(value).replace("'", "''") + "'"
+
+    def __prepare_settings(self, off_list: list) -> dict:
+        """
+        Get every planner setting of a plan with the given operations turned off
+        :param off_list: List of operations to turn off, or on for those off by default
+        :return: dict of setting name to value
+        """
+        settings = {value: self.__method_setting(key, off_list) for key, value in self.planner_methods.items()}
+        settings.update(self.planner_settings)
+        return settings
+
+    def __method_setting(self, op: str, off_list: list) -> str:
+        """
+        Get the value of the planner method switch of an operation
+        :param op: The operation
+        :param off_list: List of operations to turn off, or on for those off by default
+        :return: "on" or "off"
+        """
+        return "on" if (op in off_list) == (op in self.off_by_default) else "off"
+
+    def __prepare_plan_query(self, explain_query: str, off_list: list, extra_settings: dict = None) -> str:
+        """
+        Generate the EXPLAIN query for a plan with the given operations turned off
+        :param explain_query: The EXPLAIN query
+        :param off_list: List of operations to turn off
+        :param extra_settings: Other planner settings of the plan, values formatted for SQL
+        :return: sql statements
+        """
+        constraints = self.__prepare_constraints_query(off_list)
+        settings = "".join(f" SET {key} = {value};" for key, value in self.planner_settings.items())
+        # Set locally, so that they end with the plan's transaction
+        settings += "".join(f" SET LOCAL {key} = {value};" for key, value in (extra_settings or {}).items())
+        return f'{constraints}{settings} ' + explain_query
+
+    def __get_statement_timeout(self, analyze: bool = False):
+        """
+        Get the statement timeout of the next EXPLAIN: the plan timeout, or the EXPLAIN ANALYZE timeout,
+        capped by what is left of the request budget
+        :param analyze: Use EXPLAIN ANALYZE
+        :return: timeout in ms, None if not limited
+        """
+        timeout = self.analyze_timeout if analyze else self.plan_timeout
+        if self.__deadline is not None:
+            left = max(1, int((self.__deadline - time.perf_counter()) * 1000))
+            timeout = left if timeout is None else min(timeout, left)
+        return int(timeout) if timeout is not None else None
+
+    @staticmethod
+    def __prepare_explain_query(sql_query: str, analyze: bool = False, timeout: int = None) -> str:
+        """
+        Generate the EXPLAIN query
+        :param sql_query: The SQL query
+        :param analyze: Use EXPLAIN ANALYZE
+        :param timeout: Statement timeout in ms, set for the rest of the transaction if given
+        :return: sql statements
+        """
+        q = f"SET LOCAL statement_timeout = {timeout}; " if timeout is not None else ""
+        if not analyze:
+            return q + "EXPLAIN (VERBOSE, FORMAT JSON) " + sql_query
+
+        return q + "EXPLAIN (ANALYZE, BUFFERS, TIMING, VERBOSE, FORMAT JSON) " + sql_query
+
+    def __generate_plans_pooled(self, sql_query: str, on_plan=None):
+        """
+        Generate the QEP and the AQPs at the same time, one pooled connection per plan
+        The AQPs of speculative_ops are planned along with the QEP, those it does not use are dropped afterwards.
+        The AQPs of the other operations the QEP uses are planned once it is ready.
+        Nothing is planned ahead when the AQPs are analyzed, EXPLAIN ANALYZE runs the query
+        :param sql_query: The SQL query
+        :param on_plan: Called with (operation turned off, root node) as each plan is merged
+        :return: None
+        """
+        from concurrent.futures import ThreadPoolExecutor  # Only needed in pooled mode
+
+        def submit(t: str):
+            return executor.submit(self.__get_plan, sql_query, [t], True, analyze_aqps)
+
+        analyze_aqps = self.analyze and self.analyze_aqps
+        speculative = [] if analyze_aqps else [t for t in self.__get_aqp_operations() if t in self.speculative_ops]
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            qep_future = executor.submit(self.__get_plan, sql_query, [], True, self.analyze)
+            aqp_futures = {t: submit(t) for t in speculative}
+
+            try:
+                self.qep = self.__build_plan(qep_future.result(), "QEP")
+            except BaseException:
+                # Don't wait for the AQPs of a query that failed to plan
+                for future in aqp_futures.values():
+                    future.cancel()
+                raise
+            if on_plan:
+                on_plan(None, self.qep)
+            operations = self.__get_aqp_operations(PlanNode.get_unique_node_types(self.qep))
+
+            for t, future in aqp_futures.items():
+                if t not in operations:
+                    future.cancel()  # Dropped if it has not started yet
+            for t in operations:
+                if t not in aqp_futures:
+                    aqp_futures[t] = submit(t)
+
+            # Merge back in a fixed order regardless of which plan finished first
+            for t in operations:
+                future = aqp_futures[t]
+                try:
+                    plan = future.result()
+                except PlanTimedOut:
+                    self.__add_timed_out_aqp(t, on_plan)
+                    continue
+                self.__add_aqp(t, self.__build_plan(plan, t), on_plan)
 
     def __generate_qep(self, sql_query: str):
         """
@@ -68,92 +872,190 @@ class QueryPlanner:
         :param sql_query: The SQL query
         :return: None
         """
-        constraints = self.__prepare_constraints_query([])
-        q = f'{constraints} SET max_parallel_workers_per_gather = 0; EXPLAIN (VERBOSE, FORMAT JSON) ' + sql_query
-        plan = self.__get_sql_query_plan(q)
-        self.qep = self.__build_tree_from_raw_plan(plan)
+        plan = self.__get_plan(sql_query, [], analyze=self.analyze)
+        self.qep = self.__build_plan(plan, "QEP")
 
-    def __generate_aqps(self, sql_query: str):
+    def __generate_aqps(self, sql_query: str, on_plan=None):
         """
         Generate AQPs by limiting 1 constraint at a time
         :param sql_query: The SQL query
+        :param on_plan: Called with (operation turned off, root node) as each AQP is ready
         :return: None
         """
         assert self.qep, "QEP has to be generated first"
 
-        join_types = ["Hash Join", "Nested Loop", "Merge Join"]
-        scan_types = ["Seq Scan", "Bitmap Heap Scan", "Index Scan"]
         unique_types = PlanNode.get_unique_node_types(self.qep)
 
         # Generate AQP by limiting 1 operation type per plan
-        for t in join_types + scan_types:
-            if t in unique_types:
-                constraints = self.__prepare_constraints_query([t])
-                q = f'{constraints} SET max_parallel_workers_per_gather = 0; EXPLAIN (VERBOSE, FORMAT JSON) ' + sql_query
-                plan = self.__get_sql_query_plan(q)
-                root = self.__build_tree_from_raw_plan(plan)
-                self.alt_plan_names.append(t)
-                PlanNode.compare_trees(self.qep, root)  # mark diff
-
-                if t in join_types:
-                    other_ops = [x for x in join_types if x != t]
-                else:
-                    other_ops = [x for x in scan_types if x != t]
-                annotation = extra_annotation(op=t, other_ops=other_ops, reduction=root.cost/self.qep.cost)
-                self.extra_annotation[t] = annotation
-                self.aqp[t] = root
+        for t in self.__get_aqp_operations(unique_types):
+            try:
+                plan = self.__get_plan(sql_query, [t], analyze=self.analyze and self.analyze_aqps)
+            except PlanTimedOut:
+                self.__add_timed_out_aqp(t, on_plan)
+                continue
+            self.__add_aqp(t, self.__build_plan(plan, t), on_plan)
 
-    @staticmethod
-    def __prepare_constraints_query(off_list: list) -> str:
+    def __add_aqp(self, t: str, root: PlanNode, on_plan=None):
+        """
+        Store an AQP and compare it against the QEP
+        :param t: The operation turned off
+        :param root: Root node of the AQP
+        An AQP planned the same as the QEP is not stored, the operation is unavoidable
+        :param on_plan: Called with (t, root) once the AQP is stored
+        :return: None
+        """
+        if PlanNode.get_signature(root) == PlanNode.get_signature(self.qep):
+            self.unavoidable.append(t)
+            return
+
+        self.alt_plan_names.append(t)
+        with timed(self.collector, "diff"):
+            PlanNode.compare_trees(self.qep, root)  # mark diff
+
+        if t in self.join_types:
+            other_ops = [x for x in self.join_types if x != t]
+        elif t in self.scan_types:
+            other_ops = [x for x in self.scan_types if x != t]
+        else:
+            other_ops = self.alternative_ops[t]
+        # Time saved by the QEP, when predicted
+        saved_ms = None
+        if t in self.predicted_time and "QEP" in self.predicted_time:
+            saved_ms = self.predicted_time[t] - self.predicted_time["QEP"]
+        # The AQP may still use the operation in places, without the penalty of doing so
+        cost = self.without_disable_cost(root.cost)
+        if t in self.off_by_default:
+            annotation = enabled_annotation(op=t, other_ops=other_ops, reduction=self.qep.cost/cost,
+                                            saved_ms=-saved_ms if saved_ms is not None else None)
+        else:
+            annotation = extra_annotation(op=t, other_ops=other_ops, reduction=cost/self.qep.cost,
+                                          saved_ms=saved_ms)
+        self.extra_annotation[t] = annotation
+        self.aqp[t] = root
+        if on_plan:
+            on_plan(t, root)
+
+    def get_extra_annotations(self, node_type: str) -> list:
+        """
+        Get the extra annotations of the operations planning nodes of a type, e.g. those of partitionwise joins,
+        partitionwise aggregates and partition pruning for Append nodes
+        :param node_type: The node type
+        :return: list of annotations
+        """
+        return [self.extra_annotation[op] for op in self.planner_methods
+                if op in self.extra_annotation and node_type in self.operation_node_types.get(op, [op])]
+
+    def __add_timed_out_aqp(self, t: str, on_plan=None):
+        """
+        Report an AQP that timed out
+        :param t: The operation turned off
+        :param on_plan: Called with (t, None)
+        :return: None
+        """
+        self.timed_out.append(t)
+        if on_plan:
+            on_plan(t, None)
+
+    def __build_plan(self, plan: dict, plan_name: str) -> PlanNode:
+        """
+        Build the plan tree of a QEP or AQP, reporting its size to the collector and predicting its time
+        :param plan: The raw plan
+        :param plan_name: "QEP", or the operation turned off in the AQP
+        :return: root node of the plan tree
+        """
+        with timed(self.collector, "build"):
+            root = self.build_tree_from_raw_plan(plan)
+
+        if self.collector:
+            self.collector.on_plan(plan_name, sum(1 for _ in preorder(root)))
+        if self.cost_model:
+            with timed(self.collector, "predict"):
+                self.predicted_time[plan_name] = self.cost_model.predict(root)
+        return root
+
+    def __prepare_constraints_query(self, off_list: list) -> str:
         """
         Generate the Planner Method Configuration query
-        :param off_list: List of operations to turn off
+        :param off_list: List of operations to turn off, or on for those off by default
         :return: sql statements
         """
         q = ""
 
-        ops = {
-            "Hash Join": "enable_hashjoin",
-            "Index Scan": "enable_indexscan",
-            "Merge Join": "enable_mergejoin",
-            "Nest Loop": "enable_nestloop",
-            "Seq Scan": "enable_seqscan",
-            "Bitmap Heap Scan": "enable_bitmapscan"
-        }
-
-        for key, value in ops.items():
-            if key in off_list:
-                q += f"Set {value} to off;"
-            else:
-                q += f"Set {value} to on;"
+        for key, value in self.planner_methods.items():
+            q += f"Set {value} to {self.__method_setting(key, off_list)};"
 
         return q
 
+    def __get_aqp_operations(self, unique_types: list = None) -> list:
+        """
+        Get the operations an AQP is generated for, joins first, then scans and the other operations
+        :param unique_types: Node types of the QEP, only the operations it uses are returned if given
+        :return: list of operations
+        """
+        ops = self.join_types + self.scan_types
+        ops = [t for t in ops + [t for t in self.planner_methods if t not in ops] if t in self.planner_methods]
+        if unique_types is None:
+            return ops
+        return [t for t in ops if self.__uses_operation(t, unique_types)]
+
+    def __uses_operation(self, op: str, unique_types: list) -> bool:
+        """
+        Check if a plan uses an operation, i.e. an AQP turning it off (or on) may differ from the plan
+        :param op: The operation
+        :param unique_types: Node types of the plan
+        :return: True if the plan uses the operation
+        """
+        return any(t in unique_types for t in self.operation_node_types.get(op, [op]))
+
     @staticmethod
-    def __build_tree_from_raw_plan(plan: dict) -> PlanNode:
+    def without_disable_cost(cost: float) -> float:
+        """
+        Remove the penalties of turned off operations the planner could not avoid from the cost of a plan
+        :param cost: Total cost of the plan
+        :return: The cost without the penalties
+        """
+        return round(cost - round(cost / disable_cost) * disable_cost, 2)
+
+    @staticmethod
+    def build_tree_from_raw_plan(plan) -> PlanNode:
         """
         Build plan tree from the given plan
-        :param plan: The plan
+        :param plan: The plan, decoded or as JSON text, either EXPLAIN (FORMAT JSON) output or its plan
         :return: root node of the plan tree
         """
+        if isinstance(plan, str):
+            return QueryPlanner.build_tree_from_plan_text(plan)
+        if isinstance(plan, list):
+            plan = plan[0]["Plan"]
 
-        def dfs(parent: PlanNode, p: list):
-            if not p:
-                return
-
-            for item in p:
-                node = PlanNode.create_node(plan=item)
-                parent.children.append(node)
-                if "Plans" in item:
-                    dfs(node, item["Plans"])
-                else:
-                    continue
+        nodes = {}  # Plan node of each raw plan node, by id
+        children = {}  # Children of each plan node with any, by id
+        for item, parent, _ in preorder(plan, raw_plan_children):
+            node = PlanNode.create_node(plan=item)
+            nodes[id(item)] = node
+            if parent is not None:
+                children.setdefault(id(parent), []).append(node)
 
-        root = PlanNode.create_node(plan=plan)
-        if "Plans" in plan:
-            dfs(root, plan["Plans"])
+        for key, nodes_children in children.items():
+            nodes[key].children = tuple(nodes_children)
+        return nodes[id(plan)]
 
-        return root
+    @staticmethod
+    def build_tree_from_plan_text(text: str) -> PlanNode:
+        """
+        Build plan tree while decoding the plan JSON, each node is built as soon as its JSON object is decoded and the
+        object is dropped, so the decoded plan is never held as a whole next to the tree
+        :param text: EXPLAIN (FORMAT JSON) output, or the JSON of its plan
+        :return: root node of the plan tree
+        """
+        try:
+            plan = json.loads(text, object_hook=PlanNode.from_json_object)
+        except RecursionError:
+            # json.loads recurses once per nesting level, deep plans are decoded without recursion instead
+            plan = decode_json(text, object_hook=PlanNode.from_json_object)
+        if isinstance(plan, list):
+            plan = plan[0]["Plan"]
+        return plan
 
     @staticmethod
     def print_plan_tree(root: PlanNode) -> None:
@@ -162,12 +1064,10 @@ class QueryPlanner:
         :param root: Root of the plan
         :return: None
         """
-        def printTree(node, nodeInfo, indent=""):
-            label, children = nodeInfo(node)
-            print(indent[:-3] + "|_ " * bool(indent) + str(label))
-            for more, child in enumerate(children, 1 - len(children)):
-                childIndent = "|  " if more else "   "
-                printTree(child, nodeInfo, indent + childIndent)
-
         print("Plan cost: ", root.cost)
-        printTree(root, lambda n: (n.type, n.children))
+        indents = {root: ""}
+        for node, _, _ in preorder(root):
+            indent = indents.pop(node)
+            print(indent[:-3] + "|_ " * bool(indent) + str(node.type))
+            for more, child in enumerate(node.children, 1 - len(node.children)):
+                indents[child] = indent + ("|  " if more else "   ")
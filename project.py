@@ -1 +1,4 @@
-exec(open("interface.py").read())
\ No newline at end of file
+from interface import main
+
+if __name__ == "__main__":
+    main()
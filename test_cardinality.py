@@ -0,0 +1,53 @@
+import unittest
+
+from cardinality import find_misestimates, q_error
+from test_plan_diff import build, raw
+
+
+def ran(node_type: str, estimated: int, actual: int, *children, loops: int = 1, **fields) -> dict:
+    """
+    Build a raw plan node of an analyzed plan
+    :param node_type: Node type
+    :param estimated: Estimated rows per loop
+    :param actual: Actual rows per loop
+    :param children: Raw child nodes
+    :param loops: Actual loops, 0 if the node never ran
+    :param fields: Other fields, see test_plan_diff.raw
+    :return: The raw plan node
+    """
+    return raw(node_type, *children, **{"Plan Rows": estimated, "Actual Rows": actual, "Actual Loops": loops,
+                                        "Actual Total Time": 1.0}, **fields)
+
+
+class MisestimateTest(unittest.TestCase):
+
+    def test_q_error(self):
+        self.assertEqual(q_error(10, 10), 1.0)
+        self.assertEqual(q_error(100, 10), 10.0)
+        self.assertEqual(q_error(10, 100), 10.0)
+        self.assertEqual(q_error(0, 5), 5.0)  # Counts are taken as at least 1 row
+
+    def test_origins_first(self):
+        root = build(ran("Hash Join", 10, 5000,
+                         ran("Seq Scan", 1000, 1000, relation="orders"),
+                         ran("Hash", 10, 1000, ran("Seq Scan", 10, 1000, relation="customer"))))
+        misestimates = find_misestimates(root)
+        self.assertEqual([(m.node.type, m.q_error, m.origin) for m in misestimates],
+                         [("Hash Join", 500.0, True), ("Seq Scan", 100.0, True), ("Hash", 100.0, False)])
+        self.assertEqual(misestimates[1].node.table_name, "customer")
+        self.assertEqual(misestimates[2].inherited, 100.0)
+        self.assertTrue(misestimates[0].underestimate)
+
+    def test_loops_and_nodes_never_run(self):
+        root = build(ran("Append", 100, 200,
+                         ran("Nested Loop", 100, 200,
+                             ran("Seq Scan", 10, 10, relation="orders"),
+                             ran("Index Scan", 1, 20, loops=10, relation="customer")),
+                         ran("Seq Scan", 1000, 0, loops=0, relation="lineitem")))
+        [misestimate] = find_misestimates(root)
+        self.assertEqual((misestimate.node.type, misestimate.estimated, misestimate.actual), ("Index Scan", 10, 200))
+        self.assertEqual(find_misestimates(root, threshold=100.0), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
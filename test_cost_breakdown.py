@@ -0,0 +1,41 @@
+import unittest
+
+from cost_breakdown import FlatPlans, disable_cost, node_label, without_disable_cost
+from test_plan_diff import build, raw, scan
+
+
+def costed(node_type: str, cost: float, *children, **fields) -> dict:
+    return raw(node_type, *children, **{"Total Cost": cost}, **fields)
+
+
+class FlatPlansTest(unittest.TestCase):
+
+    def test_exclusive_cost(self):
+        # A Limit stops early, so it costs less than its input
+        qep = build(costed("Limit", 60.0, costed("Sort", 150.0, costed("Seq Scan", 100.0, relation="orders"))))
+        breakdown = FlatPlans([qep])
+        self.assertEqual(breakdown.exclusive_cost.tolist(), [-90.0, 50.0, 100.0])
+        self.assertEqual([node_label(n) for n, _, _ in breakdown.top_operators()],
+                         ["Seq Scan on orders", "Sort", "Limit"])
+        self.assertEqual(breakdown.heat(), {qep: 0.0, qep.children[0]: 0.5, qep.children[0].children[0]: 1.0})
+
+    def test_disable_cost_removed(self):
+        # The planner could not avoid the Sort it was told not to use
+        aqp = build(costed("Limit", disable_cost + 120.25,
+                           costed("Sort", disable_cost + 150.5, costed("Seq Scan", 100.0, relation="orders"))))
+        self.assertEqual(FlatPlans([aqp]).exclusive_cost.tolist(), [-30.25, 50.5, 100.0])
+        self.assertEqual(float(without_disable_cost(3 * disable_cost - 0.01)), -0.01)
+
+    def test_type_deltas(self):
+        qep = build(costed("Hash Join", 300.0, scan("orders"), costed("Hash", 120.0, scan("customer"))))
+        aqp = build(costed("Merge Join", 450.0, costed("Sort", 150.0, scan("orders")),
+                           costed("Sort", 130.0, scan("customer"))))
+        breakdown = FlatPlans([qep, aqp])
+        deltas = dict(zip(breakdown.type_names.tolist(), breakdown.type_deltas()[1].tolist()))
+        self.assertEqual(deltas, {"Hash": -20.0, "Hash Join": -80.0, "Merge Join": 170.0, "Seq Scan": 0.0,
+                                  "Sort": 80.0})
+        self.assertEqual(breakdown.plan_cost.tolist(), [300.0, 450.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from plan_cache import PlanCache, make_plan_key, normalize_sql
+
+
+class NormalizeSqlTest(unittest.TestCase):
+
+    def test_formatting(self):
+        self.assertEqual(normalize_sql("SELECT  *\n\tFROM   Orders ;"), "select * from orders")
+        self.assertEqual(normalize_sql("select * from t where a = $1"), "select * from t where a = $1")
+
+    def test_quoted_text_kept(self):
+        for query in ["select 'O''Neil Foo'", 'select "Col" from t', "select $$Foo$$", "select $tag$A $$ B$tag$",
+                      "select E'it\\'s Foo'", "select e'\\\\' || 'Bar'"]:
+            self.assertEqual(normalize_sql(query), query)
+
+    def test_literals_keep_keys_apart(self):
+        for a, b in [("select 'Foo'", "select 'foo'"),
+                     ("select $$Foo$$", "select $$foo$$"),
+                     ("select $x$Foo$x$", "select $x$foo$x$"),
+                     ("select E'it\\'s Foo'", "select E'it\\'s foo'")]:
+            self.assertNotEqual(make_plan_key(a, [], {}), make_plan_key(b, [], {}))
+
+    def test_comments(self):
+        self.assertEqual(normalize_sql("SELECT *  -- all columns\nFROM T"), "select * from t")
+        self.assertEqual(normalize_sql("select /*+ SeqScan(T) */ * FROM T"), "select /*+ SeqScan(T) */ * from t")
+        self.assertEqual(normalize_sql("select 'a -- b' -- it's\nFROM T"), "select 'a -- b' from t")
+
+    def test_comments_keep_keys_apart(self):
+        for a, b in [("select * from a -- note\njoin b on true", "select * from a -- note join b on true"),
+                     ("select * from a -- it's\nwhere c = 'Foo'", "select * from a -- it's\nwhere c = 'foo'")]:
+            self.assertNotEqual(make_plan_key(a, [], {}), make_plan_key(b, [], {}))
+
+    def test_unquoted_text_after_literals(self):
+        self.assertEqual(normalize_sql("SELECT $$Foo$$ FROM T WHERE E'\\'X' = B"),
+                         "select $$Foo$$ from t where E'\\'X' = b")
+
+
+class PlanCacheTest(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = PlanCache(max_size=2)
+        a, b, c = (make_plan_key(f"select {x}", [], {}) for x in "abc")
+        cache.put(a, "plan a")
+        cache.put(b, "plan b")
+        self.assertEqual(cache.get(a), "plan a")  # b is now the least recently used
+        cache.put(c, "plan c")
+        self.assertIsNone(cache.get(b))
+        self.assertEqual(cache.get(c), "plan c")
+        self.assertEqual(cache.get(a), "plan a")
+        self.assertEqual(cache.stats(), {"hits": 3, "misses": 1, "size": 2})
+
+    def test_invalidate(self):
+        cache = PlanCache()
+        cache.put(make_plan_key("SELECT 1", [], {}), "qep")
+        cache.put(make_plan_key("select 1", ["Sort"], {}), "aqp")
+        cache.put(make_plan_key("select 2", [], {}), "other")
+        cache.invalidate("select  1;")
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get(make_plan_key("select 2", [], {})), "other")
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled(self):
+        cache = PlanCache(max_size=0)
+        key = make_plan_key("select 1", [], {})
+        cache.put(key, "plan")
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.stats(), {"hits": 0, "misses": 1, "size": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import time
+import unittest
+
+import plan_diff
+from benchmark import synthetic_plan
+from node import PlanNode
+from plan_diff import diff_trees
+from plan_walk import preorder
+from preprocessing import QueryPlanner
+
+
+def raw(node_type: str, *children, **fields) -> dict:
+    """
+    Build a raw plan node
+    :param node_type: Node type
+    :param children: Raw child nodes
+    :param fields: Other fields, relation is the "Relation Name"
+    :return: The raw plan node
+    """
+    plan = {"Node Type": node_type, "Startup Cost": 0.0, "Total Cost": 100.0, "Plan Rows": 10}
+    if "relation" in fields:
+        plan["Relation Name"] = fields.pop("relation")
+    plan.update(fields)
+    if children:
+        plan["Plans"] = list(children)
+    return plan
+
+
+def build(plan: dict) -> PlanNode:
+    return QueryPlanner.build_tree_from_raw_plan(plan)
+
+
+def scan(relation: str) -> dict:
+    return raw("Seq Scan", relation=relation)
+
+
+def labels(nodes: list) -> list:
+    return [(n.type, getattr(n, "table_name", None)) for n in nodes]
+
+
+class DiffTreesTest(unittest.TestCase):
+
+    def assertCoversAlternative(self, diff, alt):
+        """
+        Every alternative node is matched, relabelled, moved or inserted, exactly once
+        """
+        nodes = [n for _, n in diff.matched] + [n for _, n in diff.relabelled] + [n for _, n in diff.moved]
+        nodes += diff.inserted
+        self.assertCountEqual(nodes, [n for n, _, _ in preorder(alt)])
+
+    def test_identical(self):
+        plan = raw("Hash Join", scan("orders"), raw("Hash", scan("customer")), **{"Hash Cond": "(a = b)"})
+        org, alt = build(plan), build(plan)
+        diff = diff_trees(org, alt)
+        self.assertEqual(diff.distance, 0)
+        self.assertTrue(diff.exact)
+
+    def test_swapped_join_inputs(self):
+        org = build(raw("Nested Loop", scan("orders"), raw("Index Scan", relation="customer")))
+        alt = build(raw("Nested Loop", raw("Index Scan", relation="customer"), scan("orders")))
+        diff = diff_trees(org, alt)
+        self.assertEqual(diff.distance, 1)
+        self.assertEqual(len(diff.moved), 1)
+        self.assertEqual(diff.inserted + diff.deleted + diff.relabelled, [])
+        self.assertIn(alt, [n for _, n in diff.matched])
+        self.assertCoversAlternative(diff, alt)
+
+    def test_append_reordering(self):
+        org = build(raw("Append", scan("p1"), scan("p2"), scan("p3")))
+        alt = build(raw("Append", scan("p3"), scan("p1"), scan("p2")))
+        diff = diff_trees(org, alt)
+        self.assertEqual(labels([n for _, n in diff.moved]), [("Seq Scan", "p3")])
+        self.assertEqual(diff.distance, 1)
+        self.assertCoversAlternative(diff, alt)
+
+    def test_wrapping_limit(self):
+        join = raw("Hash Join", scan("orders"), raw("Hash", scan("customer")), **{"Hash Cond": "(a = b)"})
+        org = build(join)
+        alt = build(raw("Limit", join))
+        diff = diff_trees(org, alt)
+        self.assertEqual(diff.inserted, [alt])
+        self.assertEqual(diff.distance, 1)
+        self.assertCoversAlternative(diff, alt)
+
+    def test_replaced_operation(self):
+        org = build(raw("Hash Join", scan("orders"), raw("Hash", scan("customer")), **{"Hash Cond": "(a = b)"}))
+        alt = build(raw("Merge Join", raw("Sort", scan("orders")), raw("Sort", scan("customer")),
+                        **{"Merge Cond": "(a = b)"}))
+        diff = diff_trees(org, alt)
+        self.assertEqual(labels([n for _, n in diff.relabelled]), [("Merge Join", None), ("Sort", None)])
+        self.assertEqual(labels(diff.inserted), [("Sort", None)])
+        self.assertEqual(diff.deleted, [])
+        self.assertCoversAlternative(diff, alt)
+
+    def test_replaced_and_swapped_operation(self):
+        org = build(raw("Hash Join", scan("orders"), raw("Hash", scan("customer")), **{"Hash Cond": "(a = b)"}))
+        alt = build(raw("Merge Join", raw("Sort", scan("customer")), scan("orders"), **{"Merge Cond": "(a = b)"}))
+        diff = diff_trees(org, alt)
+        self.assertEqual(labels([n for _, n in diff.relabelled]), [("Merge Join", None), ("Sort", None)])
+        self.assertEqual(diff.moved, [])
+        self.assertEqual(diff.distance, 2)
+        self.assertCoversAlternative(diff, alt)
+
+    def test_compare_trees_marks_changes(self):
+        org = build(raw("Append", scan("p1"), scan("p2")))
+        alt = build(raw("Limit", raw("Append", scan("p1"), scan("p2"))))
+        PlanNode.compare_trees(org, alt)
+        self.assertEqual([n.is_diff for n, _, _ in preorder(alt)], [True, False, False, False])
+
+    def test_greedy_fallback(self):
+        org = build(raw("Hash Join", scan("orders"), raw("Hash", scan("customer")), **{"Hash Cond": "(a = b)"}))
+        alt = build(raw("Nested Loop", scan("orders"), raw("Index Scan", relation="customer")))
+        limit = plan_diff.ted_limit
+        plan_diff.ted_limit = 0
+        try:
+            diff = diff_trees(org, alt)
+        finally:
+            plan_diff.ted_limit = limit
+        self.assertFalse(diff.exact)
+        self.assertIn((org, alt), diff.relabelled)
+        self.assertCoversAlternative(diff, alt)
+
+    def test_large_dissimilar_plans_are_fast(self):
+        org = build(synthetic_plan(500, seed=1))
+        alt = build(synthetic_plan(500, seed=2))
+        start = time.perf_counter()
+        diff = diff_trees(org, alt)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertFalse(diff.exact)
+        self.assertCoversAlternative(diff, alt)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import unittest
+
+from plan_replay import PlanReplayer
+from preprocessing import QueryPlanner
+from test_plan_diff import raw, scan
+
+
+class ReplayTest(unittest.TestCase):
+
+    def fixture(self, lines: list) -> str:
+        """
+        Write a fixture file, removed after the test
+        :param lines: Items of the fixture
+        :return: Path of the file
+        """
+        fd, path = tempfile.mkstemp(suffix=".jsonl")
+        with os.fdopen(fd, "w") as f:
+            f.writelines(json.dumps(line) + "\n" for line in lines)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_empty_fixture_never_connects(self):
+        for lines in [[], [{"planner_methods": {"Hash Join": "enable_hashjoin"}}]]:
+            planner = QueryPlanner(replay_path=self.fixture(lines))
+            self.assertEqual(len(planner.replayer), 0)
+            self.assertIsNone(planner.conn)
+            with self.assertRaisesRegex(Exception, "No recorded plan"):
+                planner.generate_plans("select 1")
+            planner.close()
+
+    def test_planner_methods_restored(self):
+        methods = {"Hash Join": "enable_hashjoin", "Seq Scan": "enable_seqscan"}
+        replayer = PlanReplayer(self.fixture([{"planner_methods": methods}]))
+        self.assertEqual(replayer.planner_methods, methods)
+        self.assertEqual(QueryPlanner(replay_path=self.fixture([{"planner_methods": methods}])).planner_methods,
+                         methods)
+
+    def test_unavoidable_operations(self):
+        methods = {"Hash Join": "enable_hashjoin", "Sort": "enable_sort"}
+        query = "select * from orders join customer on a = b order by c"
+
+        def statement(*settings) -> str:
+            constraints = "".join(f"Set {s} to {v};" for s, v in settings)
+            return constraints + " SET max_parallel_workers_per_gather = 0; EXPLAIN (VERBOSE, FORMAT JSON) " + query
+
+        def plan(join: dict, cost: float) -> list:
+            return [{"Plan": raw("Sort", join, **{"Total Cost": cost})}]
+
+        hash_join = raw("Hash Join", scan("orders"), raw("Hash", scan("customer")))
+        merge_join = raw("Merge Join", raw("Sort", scan("orders")), raw("Sort", scan("customer")))
+        lines = [
+            {"planner_methods": methods},
+            {"statement": statement(("enable_hashjoin", "on"), ("enable_sort", "on")), "plan": plan(hash_join, 100)},
+            {"statement": statement(("enable_hashjoin", "off"), ("enable_sort", "on")), "plan": plan(merge_join, 150)},
+            # Same plan as the QEP, with the penalty of the Sort the planner could not avoid
+            {"statement": statement(("enable_hashjoin", "on"), ("enable_sort", "off")),
+             "plan": plan(hash_join, 1.0e10 + 100)},
+        ]
+        planner = QueryPlanner(replay_path=self.fixture(lines))
+        planner.generate_plans(query)
+        self.assertEqual(planner.alt_plan_names, ["Hash Join"])
+        self.assertEqual(planner.unavoidable, ["Sort"])
+        self.assertNotIn("Sort", planner.extra_annotation)
+        self.assertIn("cost reduction by at least 1.5x", planner.extra_annotation["Hash Join"])
+
+        # Merge Join still sorts its inputs, without the penalty of doing so
+        lines[3]["plan"] = plan(merge_join, 2.0e10 + 120)
+        planner = QueryPlanner(replay_path=self.fixture(lines))
+        planner.generate_plans(query)
+        self.assertEqual(planner.alt_plan_names, ["Hash Join", "Sort"])
+        self.assertIn("cost reduction by at least 1.2x", planner.extra_annotation["Sort"])
+
+    def test_partition_annotations_on_append(self):
+        planner = QueryPlanner(replay_path=self.fixture([{"planner_methods": {
+            "Partitionwise Join": "enable_partitionwise_join", "Partition Pruning": "enable_partition_pruning",
+            "Tid Scan": "enable_tidscan"}}]))
+        planner.extra_annotation = {"Partitionwise Join": "join", "Partition Pruning": "pruning", "Tid Scan": "tid"}
+        self.assertEqual(planner.get_extra_annotations("Append"), ["join", "pruning"])
+        self.assertEqual(planner.get_extra_annotations("Tid Range Scan"), ["tid"])
+        self.assertEqual(planner.get_extra_annotations("Seq Scan"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+import unittest
+
+from benchmark import load_replay_cases
+from node import PlanNode
+from plan_replay import PlanRecorder, PlanReplayer
+from plan_walk import decode_json, postorder, preorder
+from preprocessing import QueryPlanner
+
+deep_levels = 5000
+
+
+def deep_plan_text(levels: int, leaf_table: str = "orders") -> str:
+    """
+    Get the EXPLAIN (FORMAT JSON) output of a plan of Limit nodes stacked levels deep over a scan
+    :param levels: Number of Limit nodes
+    :param leaf_table: Table of the scan
+    :return: The JSON text
+    """
+    text = json.dumps({"Node Type": "Seq Scan", "Relation Name": leaf_table, "Startup Cost": 0.0,
+                       "Total Cost": 10.0, "Plan Rows": 100})
+    head = '{"Node Type": "Limit", "Startup Cost": 0.0, "Total Cost": 10.0, "Plan Rows": 1, "Plans": ['
+    return '[{"Plan": ' + head * levels + text + "]}" * levels + "}]"
+
+
+class DecodeJsonTest(unittest.TestCase):
+
+    def test_same_as_json_loads(self):
+        for text in ['{}', '[]', ' [ {"a" : "b"} ] ', '"text"', '-1.5e3', 'null',
+                     '{"a": [1, 2.5, -0, true, false, null, "x\\"y\\u00e9"], "b": {}, "c": [[], {"d": []}]}']:
+            self.assertEqual(decode_json(text), json.loads(text))
+            self.assertEqual(decode_json(text, object_hook=sorted), json.loads(text, object_hook=sorted))
+
+    def test_invalid_json(self):
+        for text in ['', '[', '[1,]', '[1 2]', '{"a" 1}', '{"a": 1,}', '{1: 2}', '[1] x']:
+            with self.assertRaises(json.JSONDecodeError):
+                decode_json(text)
+
+    def test_deep_nesting(self):
+        value = decode_json("[" * 100000 + "]" * 100000)
+        depth = 0
+        while value:
+            value = value[0]
+            depth += 1
+        self.assertEqual(depth, 99999)
+
+
+class DeepPlanTest(unittest.TestCase):
+
+    def test_build_from_text(self):
+        root = QueryPlanner.build_tree_from_raw_plan(deep_plan_text(deep_levels))
+        self.assertEqual(max(depth for _, _, depth in preorder(root)), deep_levels)
+        self.assertEqual(sum(1 for _ in postorder(root)), deep_levels + 1)
+        self.assertEqual(sorted(PlanNode.get_unique_node_types(root)), ["Limit", "Seq Scan"])
+
+    def test_build_from_plan_only_text(self):
+        text = deep_plan_text(deep_levels)
+        plan_text = text[len('[{"Plan": '):-len("}]")]
+        root = QueryPlanner.build_tree_from_raw_plan(plan_text)
+        self.assertEqual(max(depth for _, _, depth in preorder(root)), deep_levels)
+
+    def test_signature_and_dict(self):
+        root = QueryPlanner.build_tree_from_raw_plan(deep_plan_text(deep_levels))
+        other = QueryPlanner.build_tree_from_raw_plan(deep_plan_text(deep_levels))
+        self.assertEqual(PlanNode.get_signature(root), PlanNode.get_signature(other))
+
+        plan = PlanNode.to_dict(root)
+        depth = 0
+        while plan.get("children"):
+            plan = plan["children"][0]
+            depth += 1
+        self.assertEqual(depth, deep_levels)
+
+    def test_compare_trees(self):
+        root = QueryPlanner.build_tree_from_raw_plan(deep_plan_text(deep_levels))
+        other = QueryPlanner.build_tree_from_raw_plan(deep_plan_text(deep_levels, leaf_table="lineitem"))
+        diff = PlanNode.compare_trees(root, other)
+        self.assertEqual(diff.distance, 1)
+        self.assertEqual([(n.type, n.is_diff) for n, _, _ in preorder(other) if n.is_diff], [("Seq Scan", True)])
+        self.assertNotEqual(PlanNode.get_signature(root), PlanNode.get_signature(other))
+
+    def test_replay(self):
+        fd, path = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        PlanRecorder(path).record("select 1", deep_plan_text(deep_levels), 1.0)
+
+        plan = PlanReplayer(path).get_plan("select 1")
+        root = QueryPlanner.build_tree_from_raw_plan(plan)
+        self.assertEqual(max(depth for _, _, depth in preorder(root)), deep_levels)
+
+        [(_, text)] = load_replay_cases(path)
+        self.assertEqual(text, deep_plan_text(deep_levels))
+
+
+if __name__ == "__main__":
+    unittest.main()
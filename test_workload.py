@@ -0,0 +1,46 @@
+import json
+import os
+import tempfile
+import unittest
+
+from workload import read_workload, split_sql_statements
+
+
+class WorkloadTest(unittest.TestCase):
+
+    def workload(self, suffix: str, text: str) -> str:
+        """
+        Write a workload file, removed after the test
+        :param suffix: Extension of the file
+        :param text: Content of the file
+        :return: Path of the file
+        """
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_split_quoted_semicolons(self):
+        text = "select 'a;b'; select $$x; y$$;\nselect $f$ ; $f$ -- it's; not\n; select E'\\'; ' /* ; */; -- end;"
+        self.assertEqual(split_sql_statements(text), [
+            "select 'a;b'",
+            "select $$x; y$$",
+            "select $f$ ; $f$ -- it's; not",
+            "select E'\\'; ' /* ; */",
+        ])
+
+    def test_line_without_statement(self):
+        lines = [{"id": "q1", "sql": "select 1"}, {"id": "q2", "text": "select 2"}, {"query": "select 3"}]
+        path = self.workload(".jsonl", "".join(json.dumps(line) + "\n" for line in lines) + "{\n")
+        items = list(read_workload(path))
+        self.assertEqual(items[0], ("q1", "select 1", None))
+        self.assertEqual(items[1][:2], ("q2", None))
+        self.assertIn("No SQL statement in line 2", items[1][2])
+        self.assertEqual(items[2], (3, "select 3", None))
+        self.assertEqual(items[3][:2], (4, None))
+        self.assertIn("Invalid JSON in line 4", items[3][2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+Reading the SQL statements of a workload file
+"""
+import json
+
+from plan_cache import sql_token_pattern
+
+sql_keys = ["sql", "query", "statement"]
+id_keys = ["id", "request_id", "query_id"]
+
+
+def split_sql_statements(text: str) -> list:
+    """
+    Split the content of a .sql file into statements, semicolons in quotes and comments don't split
+    :param text: The content of the file
+    :return: list of statements, without the trailing semicolons
+    """
+    statements = []
+    start = 0
+    for match in sql_token_pattern.finditer(text):
+        if match.group() == ";":
+            statements.append(text[start:match.start()].strip())
+            start = match.end()
+    statements.append(text[start:].strip())
+
+    # Drop empty statements and those made of comments only
+    return [s for s in statements if strip_sql_comments(s).strip()]
+
+
+def strip_sql_comments(statement: str) -> str:
+    """
+    Remove the comments of a statement, quoted text is kept
+    :param statement: The statement
+    :return: The statement without comments
+    """
+    return sql_token_pattern.sub(lambda m: "" if m.group().startswith(("--", "/*")) else m.group(), statement)
+
+
+def read_workload(path: str, sql_key: str = None):
+    """
+    Read the statements of a workload file
+    :param path: Path to a .jsonl or .sql file
+    :param sql_key: Key of the statement in JSON Lines records, the usual keys are tried if not given
+    :return: generator of (id, statement, error), the error is why a line has no statement, None if it has one
+    """
+    with open(path) as f:
+        if not path.endswith((".jsonl", ".json")):
+            for i, statement in enumerate(split_sql_statements(f.read())):
+                yield i + 1, statement, None
+            return
+
+        for i, line in enumerate(f):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as ex:
+                yield i + 1, None, f"Invalid JSON in line {i + 1} of {path}: {ex}"
+                continue
+            keys = [sql_key] if sql_key else sql_keys
+            statement = next((item[k] for k in keys if k in item), None)
+            query_id = next((item[k] for k in id_keys if k in item), i + 1)
+            if statement is None:
+                yield query_id, None, f"No SQL statement in line {i + 1} of {path}"
+                continue
+            yield query_id, statement, None